@@ -0,0 +1,63 @@
+import argparse
+import random
+import sys
+import tracemalloc
+from datetime import datetime
+
+from services.play_log import PlayLog, now_ms
+
+MIN_REDUCTION = 10.0
+
+
+def _events(count: int, users: int, tracks: int, seed: int = 42):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield f"user{rng.randrange(users)}", f"track-{rng.randrange(tracks):08d}"
+
+
+def measure_dict_history(count: int, users: int, tracks: int) -> int:
+    tracemalloc.start()
+    history = []
+    for user_id, music_id in _events(count, users, tracks):
+        history.append({
+            "user_id": user_id,
+            "music_id": music_id,
+            "played_at": datetime.now().isoformat()
+        })
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return used
+
+
+def measure_play_log(count: int, users: int, tracks: int) -> int:
+    tracemalloc.start()
+    log = PlayLog()
+    for user_id, music_id in _events(count, users, tracks):
+        log.append(user_id, music_id, now_ms())
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return used
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memória por evento: histórico em dicts vs PlayLog colunar")
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument("--users", type=int, default=5_000)
+    parser.add_argument("--tracks", type=int, default=20_000)
+    args = parser.parse_args()
+
+    dict_bytes = measure_dict_history(args.events, args.users, args.tracks)
+    log_bytes = measure_play_log(args.events, args.users, args.tracks)
+    reduction = dict_bytes / log_bytes
+
+    print(f"dict history: {dict_bytes / args.events:8.1f} bytes/evento")
+    print(f"PlayLog:      {log_bytes / args.events:8.1f} bytes/evento")
+    print(f"redução:      {reduction:8.1f}x")
+
+    if reduction < MIN_REDUCTION:
+        print(f"FALHA: redução abaixo de {MIN_REDUCTION}x")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+import heapq
+import itertools
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from types import SimpleNamespace
+
+import pika
+import pika.exceptions
+
+DIRECT_REPLY_TO = "amq.rabbitmq.reply-to"
+
+
+class _Queue:
+    def __init__(self, name: str, owner=None, arguments=None):
+        self.name = name
+        self.owner = owner
+        self.arguments = arguments or {}
+        self.max_priority = self.arguments.get("x-max-priority", 0)
+        self.lanes = [deque() for _ in range(self.max_priority + 1)]
+        self.consumers = []
+        self.next_consumer = 0
+
+    def _lane(self, properties) -> deque:
+        priority = getattr(properties, "priority", None) or 0
+        return self.lanes[min(priority, self.max_priority)]
+
+    def push(self, message, front: bool = False):
+        lane = self._lane(message[2])
+        if front:
+            lane.appendleft(message)
+        else:
+            lane.append(message)
+
+    def pop(self):
+        for lane in reversed(self.lanes):
+            if lane:
+                return lane.popleft()
+        raise IndexError("fila vazia")
+
+    def depth(self) -> int:
+        return sum(len(lane) for lane in self.lanes)
+
+
+# Substituto em memória do RabbitMQ: implementa apenas o subconjunto da API
+# BlockingConnection/BlockingChannel do pika usado pelo gateway, serviços e cliente.
+class InMemoryBroker:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.queues = {}
+        self.exchanges = {}
+        self.reply_consumers = {}
+
+    def connect(self, *_args, **_kwargs) -> "Connection":
+        return Connection(self)
+
+    def _route(self, exchange: str, routing_key: str):
+        if exchange == "":
+            q = self.queues.get(routing_key)
+            return [q] if q else []
+        bound = self.exchanges.get(exchange, set())
+        return [self.queues[name] for name in bound if name in self.queues]
+
+    def publish(self, exchange: str, routing_key: str, body, properties) -> bool:
+        if isinstance(body, str):
+            body = body.encode()
+        properties = properties or pika.BasicProperties()
+
+        with self.lock:
+            if exchange == "" and routing_key.startswith(DIRECT_REPLY_TO + "."):
+                channel = self.reply_consumers.get(routing_key)
+                if channel is None:
+                    return False
+                channel.deliver(None, exchange, routing_key, properties, body)
+                return True
+
+            targets = self._route(exchange, routing_key)
+            for q in targets:
+                q.push((exchange, routing_key, properties, body))
+                self._dispatch(q)
+            return bool(targets)
+
+    def _dispatch(self, q: _Queue):
+        while q.depth() and q.consumers:
+            for _ in range(len(q.consumers)):
+                consumer = q.consumers[q.next_consumer % len(q.consumers)]
+                q.next_consumer += 1
+                if consumer.channel.has_capacity(consumer):
+                    break
+            else:
+                return
+
+            exchange, routing_key, properties, body = q.pop()
+            consumer.channel.deliver(consumer, exchange, routing_key, properties, body, q)
+
+    def requeue(self, q: _Queue, message):
+        with self.lock:
+            q.push(message, front=True)
+            self._dispatch(q)
+
+
+class Channel:
+    _ids = itertools.count(1)
+
+    def __init__(self, connection: "Connection"):
+        self.connection = connection
+        self.broker = connection.broker
+        self.channel_number = next(self._ids)
+        self.prefetch_count = 0
+        self.consumers = []
+        self.unacked = {}
+        self.delivery_tags = itertools.count(1)
+        self.is_open = True
+        self._consuming = False
+        self._confirm = False
+        self._return_callbacks = []
+
+    def basic_qos(self, prefetch_count: int = 0, **_kwargs):
+        self.prefetch_count = prefetch_count
+
+    def queue_declare(self, queue: str = "", passive: bool = False, durable: bool = False,
+                      exclusive: bool = False, auto_delete: bool = False, arguments=None):
+        with self.broker.lock:
+            name = queue or f"amq.gen-{uuid.uuid4().hex}"
+            q = self.broker.queues.get(name)
+            if q is None:
+                if passive:
+                    raise pika.exceptions.ChannelClosedByBroker(404, f"NOT_FOUND - no queue '{name}'")
+                q = self.broker.queues[name] = _Queue(name, self.connection if exclusive else None, arguments)
+                if exclusive:
+                    self.connection.exclusive_queues.append(name)
+            return SimpleNamespace(method=SimpleNamespace(
+                queue=name, message_count=q.depth(), consumer_count=len(q.consumers)))
+
+    def exchange_declare(self, exchange: str, exchange_type: str = "direct", **_kwargs):
+        with self.broker.lock:
+            self.broker.exchanges.setdefault(exchange, set())
+
+    def queue_bind(self, queue: str, exchange: str, routing_key: str = None, **_kwargs):
+        with self.broker.lock:
+            self.broker.exchanges.setdefault(exchange, set()).add(queue)
+
+    def basic_consume(self, queue: str, on_message_callback, auto_ack: bool = False, **_kwargs):
+        consumer = SimpleNamespace(channel=self, queue=queue, callback=on_message_callback,
+                                   auto_ack=auto_ack, tag=f"ctag-{uuid.uuid4().hex[:8]}")
+        with self.broker.lock:
+            self.consumers.append(consumer)
+            if queue == DIRECT_REPLY_TO:
+                self.broker.reply_consumers[self.reply_to_address()] = self
+                return consumer.tag
+            q = self.broker.queues[queue]
+            q.consumers.append(consumer)
+            self.broker._dispatch(q)
+        return consumer.tag
+
+    def basic_cancel(self, consumer_tag: str):
+        with self.broker.lock:
+            for consumer in [c for c in self.consumers if c.tag == consumer_tag]:
+                self.consumers.remove(consumer)
+                q = self.broker.queues.get(consumer.queue)
+                if q and consumer in q.consumers:
+                    q.consumers.remove(consumer)
+        return []
+
+    def reply_to_address(self) -> str:
+        return f"{DIRECT_REPLY_TO}.{id(self.connection)}.{self.channel_number}"
+
+    def has_capacity(self, consumer) -> bool:
+        return consumer.auto_ack or not self.prefetch_count or len(self.unacked) < self.prefetch_count
+
+    def deliver(self, consumer, exchange, routing_key, properties, body, q=None):
+        if consumer is None:
+            consumer = next(c for c in self.consumers if c.queue == DIRECT_REPLY_TO)
+        tag = next(self.delivery_tags)
+        if not consumer.auto_ack:
+            self.unacked[tag] = (q, (exchange, routing_key, properties, body))
+        method = SimpleNamespace(delivery_tag=tag, exchange=exchange, routing_key=routing_key,
+                                 consumer_tag=consumer.tag, redelivered=False)
+        self.connection.inbox.put((consumer.callback, self, method, properties, body))
+
+    def basic_publish(self, exchange: str, routing_key: str, body, properties=None, mandatory: bool = False):
+        if properties is not None and properties.reply_to == DIRECT_REPLY_TO:
+            properties.reply_to = self.reply_to_address()
+        routed = self.broker.publish(exchange, routing_key, body, properties)
+        if mandatory and not routed:
+            if self._confirm:
+                raise pika.exceptions.UnroutableError([])
+            method = SimpleNamespace(reply_code=312, reply_text="NO_ROUTE", exchange=exchange, routing_key=routing_key)
+            for callback in self._return_callbacks:
+                self.connection.inbox.put((callback, self, method, properties, body))
+
+    def add_on_return_callback(self, callback):
+        self._return_callbacks.append(callback)
+
+    def basic_ack(self, delivery_tag: int = 0, multiple: bool = False):
+        with self.broker.lock:
+            if multiple:
+                tags = [t for t in self.unacked if t <= delivery_tag]
+            else:
+                tags = [delivery_tag]
+            queues = set()
+            for tag in tags:
+                entry = self.unacked.pop(tag, None)
+                if entry and entry[0] is not None:
+                    queues.add(entry[0])
+            for q in queues:
+                self.broker._dispatch(q)
+
+    def confirm_delivery(self):
+        self._confirm = True
+
+    def start_consuming(self):
+        self._consuming = True
+        while self._consuming and self.connection.is_open:
+            self.connection.process_data_events(time_limit=0.5)
+
+    def stop_consuming(self):
+        self._consuming = False
+
+    def close(self):
+        if not self.is_open:
+            return
+        self.is_open = False
+        with self.broker.lock:
+            for consumer in self.consumers:
+                if consumer.queue == DIRECT_REPLY_TO:
+                    self.broker.reply_consumers.pop(self.reply_to_address(), None)
+                    continue
+                q = self.broker.queues.get(consumer.queue)
+                if q and consumer in q.consumers:
+                    q.consumers.remove(consumer)
+            self.consumers = []
+            pending = list(self.unacked.values())
+            self.unacked.clear()
+        for q, message in reversed(pending):
+            if q is not None:
+                self.broker.requeue(q, message)
+
+
+class Connection:
+    def __init__(self, broker: InMemoryBroker):
+        self.broker = broker
+        self.inbox = queue.Queue()
+        self.channels = []
+        self.exclusive_queues = []
+        self.timers = []
+        self._timer_ids = itertools.count()
+        self.is_open = True
+
+    @property
+    def is_closed(self) -> bool:
+        return not self.is_open
+
+    def channel(self) -> Channel:
+        ch = Channel(self)
+        self.channels.append(ch)
+        return ch
+
+    def call_later(self, delay: float, callback):
+        heapq.heappush(self.timers, (time.monotonic() + delay, next(self._timer_ids), callback))
+
+    def _run_timers(self):
+        now = time.monotonic()
+        while self.timers and self.timers[0][0] <= now:
+            _, _, callback = heapq.heappop(self.timers)
+            callback()
+
+    def process_data_events(self, time_limit: float = 0):
+        deadline = time.monotonic() + (time_limit or 0)
+        self._run_timers()
+
+        while True:
+            wait = deadline - time.monotonic()
+            if self.timers:
+                wait = min(wait, self.timers[0][0] - time.monotonic())
+            try:
+                item = self.inbox.get(timeout=max(wait, 0)) if wait > 0 else self.inbox.get_nowait()
+            except queue.Empty:
+                self._run_timers()
+                if time.monotonic() >= deadline:
+                    return
+                continue
+
+            self._dispatch(item)
+            while True:
+                try:
+                    self._dispatch(self.inbox.get_nowait())
+                except queue.Empty:
+                    break
+            self._run_timers()
+            return
+
+    def sleep(self, duration: float):
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            self.process_data_events(time_limit=deadline - time.monotonic())
+
+    def _dispatch(self, item):
+        callback, channel, method, properties, body = item
+        if channel.is_open:
+            callback(channel, method, properties, body)
+
+    def close(self):
+        if not self.is_open:
+            return
+        self.is_open = False
+        for ch in self.channels:
+            ch.close()
+        with self.broker.lock:
+            for name in self.exclusive_queues:
+                self.broker.queues.pop(name, None)
+                for bound in self.broker.exchanges.values():
+                    bound.discard(name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        self.close()
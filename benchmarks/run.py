@@ -0,0 +1,337 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+os.environ.setdefault("SIMULATED_LATENCY_SCALE", "0")
+os.environ.setdefault("USERS_PLAY_LOG_DIR", "")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import messaging
+from benchmarks.inmemory_broker import InMemoryBroker
+from benchmarks.stub_musicbrainz import start_stub_server
+
+ZERO_BASELINE_SLACK = 0.01
+TAIL_TOLERANCE = 1.0
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+PROFILES = {
+    "full": {"plays": 1_000_000, "playlists": 1_000_000, "e2e_seconds": 5.0, "ingest_events": 20_000,
+             "media_values": 1_000_000},
+    "quick": {"plays": 100_000, "playlists": 100_000, "e2e_seconds": 2.0, "ingest_events": 5_000,
+              "media_values": 100_000},
+}
+
+BROKER = InMemoryBroker()
+messaging.build_connection = BROKER.connect
+STUB_SERVER, STUB_URL = start_stub_server()
+os.environ["MUSICBRAINZ_URL"] = STUB_URL
+
+import client
+import gateway
+import loadgen
+from services import numeric_stats, service_catalog, service_playlist, service_users
+
+
+def time_op(fn, repeat: int = 7, min_batch_seconds: float = 0.05) -> float:
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_batch_seconds or loops >= 1 << 20:
+            break
+        loops *= 4
+
+    samples = [elapsed / loops]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        samples.append((time.perf_counter() - started) / loops)
+    return min(samples) * 1e6
+
+
+def _metric(value: float, unit: str, better: str, tolerance: float = None) -> dict:
+    metric = {"value": round(value, 3), "unit": unit, "better": better}
+    if tolerance is not None:
+        metric["tolerance"] = tolerance
+    return metric
+
+
+def _wait_for_consumers(queue_names, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with BROKER.lock:
+            if all(name in BROKER.queues and BROKER.queues[name].consumers for name in queue_names):
+                return
+        time.sleep(0.01)
+    raise RuntimeError(f"componentes não iniciaram: {queue_names}")
+
+
+def start_components():
+    for target in (gateway.run, service_users.run_primary, service_playlist.run_primary, service_catalog.main):
+        threading.Thread(target=target, daemon=True).start()
+    _wait_for_consumers([messaging.RPC_GATEWAY_QUEUE, service_users.QUEUE_NAME, service_users.EVENTS_QUEUE_NAME,
+                         service_playlist.QUEUE_NAME, service_catalog.QUEUE_NAME])
+
+
+def bench_e2e(profile: dict) -> dict:
+    results = {}
+    mix = {
+        "users.play": 4,
+        "users.get_history": 3,
+        "users.most_played": 1,
+        "playlist.get": 2,
+        "playlist.add_music": 1,
+        "catalog.search": 1,
+    }
+    report = loadgen.run_bench(mix=mix, concurrency=8, duration=profile["e2e_seconds"], timeout=10, seed=7)
+    total = report["total"]
+    results["e2e.gateway_rpc.throughput"] = _metric(total["throughput_rps"], "req/s", "higher")
+    results["e2e.gateway_rpc.p50"] = _metric(total["p50_ms"], "ms", "lower")
+    results["e2e.gateway_rpc.p99"] = _metric(total["p99_ms"], "ms", "lower", TAIL_TOLERANCE)
+    results["e2e.gateway_rpc.error_rate"] = _metric(total["error_rate"] + total["timeout_rate"], "ratio", "lower")
+
+    events = profile["ingest_events"]
+    already = service_users.INGEST_STATS["events"]
+    conn = messaging.build_connection()
+    channel = conn.channel()
+    started = time.perf_counter()
+    for i in range(events):
+        client.send_event("users", "play", {"user_id": f"ingest{i % 500}", "music_id": f"m{i % 3000}"}, channel=channel)
+    deadline = time.monotonic() + 60
+    while service_users.INGEST_STATS["events"] - already < events and time.monotonic() < deadline:
+        time.sleep(0.005)
+    elapsed = time.perf_counter() - started
+    conn.close()
+    results["e2e.play_ingest.throughput"] = _metric(
+        (service_users.INGEST_STATS["events"] - already) / elapsed, "events/s", "higher")
+    return results
+
+
+def bench_priority(profile: dict) -> dict:
+    reports = {}
+
+    def run(name, mix, concurrency):
+        reports[name] = loadgen.run_bench(mix=mix, concurrency=concurrency, duration=profile["e2e_seconds"],
+                                          timeout=10, seed=11)
+
+    threads = [
+        threading.Thread(target=run, args=("bulk", {"users.play_batch": 1}, 6)),
+        threading.Thread(target=run, args=("interactive", {"users.get_history": 1}, 2)),
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    interactive = reports["interactive"]["total"]
+    return {
+        "e2e.interactive_under_bulk.p50": _metric(interactive["p50_ms"], "ms", "lower"),
+        "e2e.interactive_under_bulk.p99": _metric(interactive["p99_ms"], "ms", "lower", TAIL_TOLERANCE),
+        "e2e.bulk.throughput": _metric(reports["bulk"]["total"]["throughput_rps"], "req/s", "higher"),
+    }
+
+
+def bench_users(profile: dict) -> dict:
+    results = {}
+    rng = random.Random(42)
+    users, tracks = max(profile["plays"] // 200, 10), max(profile["plays"] // 50, 10)
+    remaining = profile["plays"] - len(service_users.PLAY_LOG)
+
+    started = time.perf_counter()
+    inserted = 0
+    while inserted < remaining:
+        batch = [
+            {"user_id": f"user{rng.randrange(users)}", "music_id": f"track{int(rng.paretovariate(1.1)) % tracks}"}
+            for _ in range(min(10_000, remaining - inserted))
+        ]
+        service_users.register_plays(batch)
+        inserted += len(batch)
+    service_users.CO_OCCURRENCE.refresh()
+    if inserted:
+        results["users.register_plays"] = _metric((time.perf_counter() - started) / inserted * 1e6, "us/event", "lower")
+
+    scale = f"@{profile['plays'] // 1000}k"
+    sample_users = [f"user{rng.randrange(users)}" for _ in range(64)]
+    sample_tracks = [f"track{rng.randrange(20)}" for _ in range(64)]
+    cycle = {"i": 0}
+
+    def next_user():
+        cycle["i"] += 1
+        return sample_users[cycle["i"] % len(sample_users)]
+
+    def next_track():
+        cycle["i"] += 1
+        return sample_tracks[cycle["i"] % len(sample_tracks)]
+
+    ops = {
+        "users.get_user_history": lambda: service_users.get_user_history(next_user(), 50),
+        "users.get_most_played": lambda: service_users.get_most_played(next_user(), 10),
+        "users.get_user_stats": lambda: service_users.get_user_stats(next_user()),
+        "users.get_recent_plays_all": lambda: service_users.get_recent_plays_all(20),
+        "users.get_global_most_played": lambda: service_users.get_global_most_played(10),
+        "users.get_trending_day": lambda: service_users.get_trending("day", None, 10),
+        "users.get_similar_tracks": lambda: service_users.get_similar_tracks(next_track(), 10),
+        "users.recommend_for_user": lambda: service_users.recommend_for_user(next_user(), 10),
+        "users.get_unique_listeners": lambda: service_users.get_unique_listeners(next_track()),
+    }
+    for name, fn in ops.items():
+        results[name + scale] = _metric(time_op(fn), "us/op", "lower")
+    return results
+
+
+def bench_playlists(profile: dict) -> dict:
+    rng = random.Random(43)
+    users = max(profile["playlists"] // 5, 10)
+    remaining = profile["playlists"] - len(service_playlist.PLAYLISTS_DATABASE)
+    playlist_ids = []
+    for _ in range(remaining):
+        playlist = service_playlist.create_playlist(f"user{rng.randrange(users)}", "bench")
+        if len(playlist_ids) < 64:
+            playlist_ids.append(playlist["id"])
+    playlist_ids = playlist_ids or list(service_playlist.PLAYLISTS_DATABASE)[:64]
+
+    scale = f"@{profile['playlists'] // 1000}k"
+    cycle = {"i": 0}
+
+    def next_playlist():
+        cycle["i"] += 1
+        return playlist_ids[cycle["i"] % len(playlist_ids)]
+
+    return {
+        "playlist.list_user_playlists" + scale: _metric(
+            time_op(lambda: service_playlist.list_user_playlists(f"user{rng.randrange(users)}"), repeat=3),
+            "us/op", "lower"),
+        "playlist.get_playlist" + scale: _metric(
+            time_op(lambda: service_playlist.get_playlist(next_playlist())), "us/op", "lower"),
+    }
+
+
+def bench_catalog() -> dict:
+    return {
+        "catalog.search_music": _metric(time_op(lambda: service_catalog.search_music("rock", 5)), "us/op", "lower"),
+        "catalog.get_music_details": _metric(
+            time_op(lambda: service_catalog.get_music_details("b1a9c0e9-d987-4042-ae91-78d6a3267d69")),
+            "us/op", "lower"),
+        "catalog.get_music_details.uncached": _metric(
+            time_op(lambda: service_catalog._fetch_music_details("b1a9c0e9-d987-4042-ae91-78d6a3267d69")),
+            "us/op", "lower"),
+    }
+
+
+def bench_media(profile: dict) -> dict:
+    rng = random.Random(44)
+    values = [rng.expovariate(1 / 210.0) for _ in range(profile["media_values"])]
+    binary_body = json.dumps({"action": "describe", "params": {"data": numeric_stats.encode_values(values)}})
+    json_body = json.dumps({"action": "describe", "params": {"numbers": values}})
+    scale = f"@{profile['media_values'] // 1000}k"
+
+    def describe(body):
+        return numeric_stats.describe(numeric_stats.decode_values(json.loads(body)["params"]))
+
+    return {
+        "media.describe.binary" + scale: _metric(time_op(lambda: describe(binary_body), repeat=3), "us/op", "lower"),
+        "media.describe.json" + scale: _metric(time_op(lambda: describe(json_body), repeat=3), "us/op", "lower"),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    regressions = []
+    for name, current in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        if not reference["value"]:
+            if current["better"] == "lower" and current["value"] > ZERO_BASELINE_SLACK:
+                regressions.append((name, reference["value"], current["value"], float("inf")))
+            continue
+        ratio = current["value"] / reference["value"]
+        allowed = max(tolerance, current.get("tolerance", 0))
+        if current["better"] == "lower" and ratio > 1 + allowed:
+            regressions.append((name, reference["value"], current["value"], ratio))
+        elif current["better"] == "higher" and ratio < 1 - allowed:
+            regressions.append((name, reference["value"], current["value"], ratio))
+    return regressions
+
+
+def print_results(results: dict, baseline: dict):
+    print(f"{'benchmark':<44}{'atual':>14}{'baseline':>14}  unidade")
+    print("-" * 84)
+    for name, current in results.items():
+        reference = baseline.get(name, {}).get("value")
+        ref = f"{reference:>14.2f}" if reference is not None else f"{'-':>14}"
+        print(f"{name:<44}{current['value']:>14.2f}{ref}  {current['unit']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks offline (broker em memória + MusicBrainz simulado)")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="full")
+    parser.add_argument("--only", choices=["e2e", "users", "playlist", "catalog", "media"], action="append",
+                       help="Executar apenas os grupos indicados")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                       help="Regressão máxima aceita em relação ao baseline (0.5 = 50%%; p99 aceita ao menos 100%%)")
+    parser.add_argument("--update-baseline", action="store_true",
+                       help="Gravar os resultados como novo baseline do perfil")
+    parser.add_argument("--out", type=str, help="Arquivo JSON para gravar os resultados")
+    args = parser.parse_args()
+
+    profile = PROFILES[args.profile]
+    groups = args.only or ["e2e", "users", "playlist", "catalog", "media"]
+    results = {}
+
+    if "e2e" in groups:
+        with contextlib.redirect_stdout(io.StringIO()):
+            start_components()
+            results.update(bench_e2e(profile))
+            results.update(bench_priority(profile))
+    if "users" in groups:
+        results.update(bench_users(profile))
+    if "playlist" in groups:
+        results.update(bench_playlists(profile))
+    if "catalog" in groups:
+        results.update(bench_catalog())
+    if "media" in groups:
+        results.update(bench_media(profile))
+
+    baselines = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baselines = json.load(f)
+    baseline = baselines.get(args.profile, {})
+
+    print_results(results, baseline)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"profile": args.profile, "results": results}, f, indent=2)
+
+    if args.update_baseline:
+        baselines[args.profile] = dict(baseline, **results)
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nBaseline '{args.profile}' atualizado em {BASELINE_PATH}")
+        return
+
+    if not baseline:
+        print(f"\nSem baseline '{args.profile}' nesta máquina; grave um com --update-baseline antes de comparar.")
+        return
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\nREGRESSÕES (tolerância {args.tolerance:.0%}):")
+        for name, reference, current, ratio in regressions:
+            print(f"  {name}: {reference} -> {current} ({ratio:.2f}x)")
+        sys.exit(1)
+    print("\nSem regressões em relação ao baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "musicbrainz")
+
+
+def _load(name: str) -> dict:
+    with open(os.path.join(FIXTURES_DIR, name)) as f:
+        return json.load(f)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    search = None
+    recording = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.rstrip("/").split("/")
+
+        if parts[-1] == "recording":
+            limit = int(parse_qs(url.query).get("limit", ["25"])[0])
+            data = dict(self.search, recordings=self.search["recordings"][:limit])
+            self._send(200, data)
+        elif len(parts) >= 2 and parts[-2] == "recording":
+            self._send(200, dict(self.recording, id=parts[-1]))
+        else:
+            self._send(404, {"error": "Not Found"})
+
+    def _send(self, status: int, data: dict):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_args):
+        pass
+
+
+def start_stub_server(host: str = "127.0.0.1", port: int = 0):
+    _Handler.search = _load("search_recording.json")
+    _Handler.recording = _load("recording.json")
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/ws/2"
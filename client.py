@@ -3,10 +3,16 @@ import json
 import uuid
 import time
 import pika
-from messaging import build_connection, RPC_GATEWAY_QUEUE
+import loadgen
+import tracing
+from logs import get_logger
+from messaging import build_connection, RPC_GATEWAY_QUEUE, PRIORITY_CLASSES
 
+LOG = get_logger("client")
 
-def call_gateway(service: str, action: str, params: dict, timeout: int = 20) -> dict:
+
+def call_gateway(service: str, action: str, params: dict, timeout: int = 20, trace_sample_rate: float = None,
+                 priority: str = None) -> dict:
     conn = build_connection()
     ch = conn.channel()
     
@@ -14,11 +20,13 @@ def call_gateway(service: str, action: str, params: dict, timeout: int = 20) ->
     callback_queue = result.method.queue
 
     corr_id = str(uuid.uuid4())
-    response_container = {"response": None}
+    response_container = {"response": None, "trace": None}
+    trace = tracing.start_trace(trace_sample_rate)
 
     def on_response(_ch, _method, props, body):
         if props.correlation_id == corr_id:
             response_container["response"] = body
+            response_container["trace"] = tracing.from_properties(props)
 
     ch.basic_consume(queue=callback_queue, on_message_callback=on_response, auto_ack=True)
 
@@ -28,17 +36,20 @@ def call_gateway(service: str, action: str, params: dict, timeout: int = 20) ->
         "params": params
     })
 
+    tracing.stamp(trace, "client.send")
     ch.basic_publish(
         exchange="",
         routing_key=RPC_GATEWAY_QUEUE,
         properties=pika.BasicProperties(
             reply_to=callback_queue,
-            correlation_id=corr_id
+            correlation_id=corr_id,
+            priority=PRIORITY_CLASSES[priority] if priority else None,
+            headers=tracing.headers_for(trace)
         ),
         body=request_body,
     )
 
-    print(f"[client] Enviando: {service}.{action} com params={params}")
+    LOG.debug("Enviando %s.%s", service, action, extra={"params": params})
 
     waited = 0
     while response_container["response"] is None and waited < timeout:
@@ -50,12 +61,37 @@ def call_gateway(service: str, action: str, params: dict, timeout: int = 20) ->
     if response_container["response"] is None:
         return {"error": "timeout esperando resposta"}
     
+    trace = response_container["trace"] or trace
+    tracing.stamp(trace, "client.recv")
+    
     try:
-        return json.loads(response_container["response"].decode())
+        return tracing.attach(json.loads(response_container["response"].decode()), trace)
     except Exception:
         return {"raw": response_container["response"].decode()}
 
 
+# Quem envia muitos eventos passa o próprio canal e o reutiliza; sem canal, a função abre e fecha
+# uma conexão só para este evento.
+def send_event(service: str, action: str, params: dict, channel=None):
+    conn = None
+    if channel is None:
+        conn = build_connection()
+        channel = conn.channel()
+    
+    channel.basic_publish(
+        exchange="",
+        routing_key=RPC_GATEWAY_QUEUE,
+        body=json.dumps({
+            "service": service,
+            "action": action,
+            "params": params
+        }),
+    )
+    
+    if conn is not None:
+        conn.close()
+
+
 def demo_catalog():
     print("\n=== DEMONSTRAÇÃO: CATÁLOGO MUSICAL ===")
 
@@ -104,6 +140,13 @@ def demo_users():
     print(f"Reprodução registrada: {result}")
     time.sleep(0.5)
     
+    send_event("users", "play_batch", {"plays": [
+        {"user_id": "user123", "music_id": "m002"},
+        {"user_id": "user123", "music_id": "m003"}
+    ]})
+    print("Lote de reproduções enviado (sem resposta)")
+    time.sleep(0.5)
+    
     result = call_gateway("users", "get_history", {
         "user_id": "user123",
         "limit": 10
@@ -141,6 +184,7 @@ def interactive_mode():
     print("  users stats <user_id>")
     print("  users recent [limit]")
     print("  users global [limit]")
+    print("  users trending [hour|day|week] [limit]")
     
     print("\nOUTROS:")
     print("  help")
@@ -354,6 +398,13 @@ def interactive_mode():
                     params = {"limit": limit}
                     action = "global_most_played"
                 
+                elif action == "trending":
+                    window = parts[2] if len(parts) > 2 and not parts[2].isdigit() else "hour"
+                    limit = int(parts[-1]) if len(parts) > 2 and parts[-1].isdigit() else 10
+                    
+                    params = {"window": window, "limit": limit}
+                    action = "trending"
+                
                 else:
                     print(f"Ação '{action}' não reconhecida para users")
                     continue
@@ -391,10 +442,44 @@ def main():
                        help="Ação a executar")
     parser.add_argument("--params", "-p", type=str,
                        help="Parâmetros em JSON")
+    parser.add_argument("--no-reply", action="store_true",
+                       help="Enviar como evento, sem aguardar resposta (ex.: users play)")
+    parser.add_argument("--bench", action="store_true",
+                       help="Modo benchmark: gera carga com um mix ponderado de ações")
+    parser.add_argument("--concurrency", type=int, default=8,
+                       help="Clientes simultâneos (closed-loop) ou máximo de requisições em voo (open-loop)")
+    parser.add_argument("--duration", type=float, default=30,
+                       help="Duração do benchmark em segundos")
+    parser.add_argument("--rate", type=float,
+                       help="Taxa alvo em req/s (open-loop); sem ela o benchmark é closed-loop")
+    parser.add_argument("--mix", type=str,
+                       help="Mix de ações, ex.: 'users.play=30,catalog.search=5'")
+    parser.add_argument("--timeout", type=float, default=20,
+                       help="Timeout por requisição em segundos")
+    parser.add_argument("--bench-out", type=str,
+                       help="Arquivo JSON para gravar o resultado do benchmark")
+    parser.add_argument("--priority", choices=sorted(PRIORITY_CLASSES),
+                       help="Classe de prioridade da requisição (padrão: política de ações do gateway)")
+    parser.add_argument("--trace-sample", type=float,
+                       help="Fração das requisições com rastreamento de latência por salto (padrão: TRACE_SAMPLE_RATE)")
     
     args = parser.parse_args()
     
-    if args.demo:
+    if args.bench:
+        report = loadgen.run_bench(
+            mix=loadgen.parse_mix(args.mix) if args.mix else None,
+            concurrency=args.concurrency,
+            duration=args.duration,
+            rate=args.rate,
+            timeout=args.timeout,
+            trace_sample_rate=args.trace_sample,
+        )
+        loadgen.print_report(report)
+        if args.bench_out:
+            with open(args.bench_out, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"\nResultado gravado em {args.bench_out}")
+    elif args.demo:
         if args.demo == "catalog" or args.demo == "all":
             demo_catalog()
         if args.demo == "playlist" or args.demo == "all":
@@ -403,16 +488,24 @@ def main():
             demo_users()
     elif args.interactive:
         interactive_mode()
+    elif args.service and args.action and args.no_reply:
+        params = json.loads(args.params) if args.params else {}
+        send_event(args.service, args.action, params)
+        print(f"Evento {args.service}.{args.action} enviado")
     elif args.service and args.action:
         params = json.loads(args.params) if args.params else {}
-        result = call_gateway(args.service, args.action, params)
+        result = call_gateway(args.service, args.action, params, trace_sample_rate=args.trace_sample,
+                              priority=args.priority)
         print(json.dumps(result, indent=2))
     else:
         parser.print_help()
         print("\nExemplos de uso:")
         print("  python client.py --demo all")
         print("  python client.py --interactive")
+        print("  python client.py --bench --concurrency 16 --duration 60 --bench-out bench.json")
+        print("  python client.py --bench --rate 200 --mix 'users.play=8,playlist.get=2'")
         print("  python client.py -s catalog -a search -p '{\"query\": \"rock\"}'")
+        print("  python client.py -s users -a play -p '{\"user_id\": \"u1\", \"music_id\": \"m001\"}' --no-reply")
 
 
 if __name__ == "__main__":
@@ -1,128 +1,367 @@
+import os
 import threading
 import uuid
 import json
 import sys
 import signal
+import time
 from typing import Optional
 import pika
+import pika.exceptions
 
-from messaging import build_connection, configure_channel_for_consume, declare_queue, RPC_GATEWAY_QUEUE
+from logs import get_logger
+from messaging import build_connection, configure_channel_for_consume, declare_queue, RPC_GATEWAY_QUEUE, PRIORITY_CLASSES
+from metrics import MetricsRegistry, UNKNOWN_LABEL, serve_prometheus, write_prometheus_file
+from recorder import RECORD_FILE, TrafficRecorder
+from registry import ServiceRegistry, subscribe_heartbeats
+from replication import READ_QUEUE_SUFFIX
+from tracing import from_properties, headers_for, stamp
 
 SERVICE_QUEUE_PREFIX = "service."
+EVENTS_QUEUE_SUFFIX = ".events"
+READ_REPLICA_SERVICES = {s for s in os.getenv("GATEWAY_READ_REPLICAS", "").split(",") if s}
+MONITORED_SERVICES = [s for s in os.getenv("GATEWAY_MONITORED_SERVICES", "users,playlist,catalog,media").split(",") if s]
+METRICS_INTERVAL = float(os.getenv("GATEWAY_METRICS_INTERVAL", "5"))
+METRICS_FILE = os.getenv("GATEWAY_METRICS_FILE", "")
+METRICS_PORT = int(os.getenv("GATEWAY_METRICS_PORT", "0"))
+READ_ACTIONS = {
+    "playlist": {"get", "list_user_playlists"},
+    "users": {
+        "get_history", "most_played", "get_stats", "recent_plays_all", "global_most_played",
+        "trending", "similar_tracks", "recommend_for_user", "unique_listeners", "daily_uniques",
+        "export_sketch", "merge_sketches"
+    },
+}
+BULK_PARAM_ITEMS = int(os.getenv("GATEWAY_BULK_PARAM_ITEMS", "100"))
+ACTION_PRIORITY = {
+    "catalog": {"search": "interactive", "list_by_artist": "interactive", "get_details": "interactive"},
+    "media": {"group_stats": "bulk", "session_append": "bulk"},
+    "playlist": {
+        "get": "interactive", "list_user_playlists": "interactive", "create": "interactive",
+        "replication_snapshot": "bulk"
+    },
+    "users": {
+        "get_history": "interactive", "most_played": "interactive", "get_stats": "interactive",
+        "recent_plays_all": "interactive", "trending": "interactive", "similar_tracks": "interactive",
+        "recommend_for_user": "interactive", "play_batch": "bulk", "global_most_played": "bulk",
+        "unique_listeners": "bulk", "daily_uniques": "bulk", "export_sketch": "bulk", "merge_sketches": "bulk",
+        "replication_snapshot": "bulk"
+    },
+}
 
-def forward_request_to_service(original_props, body: bytes):
+LOG = get_logger("gateway")
+REQUEST_LOG = get_logger("gateway.request")
+METRICS = MetricsRegistry("gateway")
+METRICS.add_collector(lambda registry: registry.set_gauge("threads", threading.active_count()))
+REGISTRY = ServiceRegistry()
+RECORDER = TrafficRecorder(RECORD_FILE) if RECORD_FILE else None
+
+
+def _collect_registry(registry):
+    for queue, info in REGISTRY.snapshot().items():
+        registry.set_gauge("service_instances", info["instances"], queue=queue)
+
+
+METRICS.add_collector(_collect_registry)
+
+
+def _collect_recorder(registry):
+    registry.set_gauge("recorded_requests", RECORDER.recorded)
+    registry.set_gauge("recorder_dropped", RECORDER.dropped)
+
+
+if RECORDER is not None:
+    METRICS.add_collector(_collect_recorder)
+
+
+class ServiceUnavailable(Exception):
+    pass
+
+
+def priority_for(service: str, action: str, params: dict, requested: Optional[int]) -> int:
+    if requested is not None:
+        return requested
+    if any(isinstance(value, list) and len(value) > BULK_PARAM_ITEMS for value in params.values()):
+        return PRIORITY_CLASSES["bulk"]
+    return PRIORITY_CLASSES[ACTION_PRIORITY.get(service, {}).get(action, "normal")]
+
+
+def service_queue_for(service: str, action: str) -> str:
+    if service in READ_REPLICA_SERVICES and action in READ_ACTIONS.get(service, ()):
+        read_queue = SERVICE_QUEUE_PREFIX + service + READ_QUEUE_SUFFIX
+        if REGISTRY.live(read_queue):
+            return read_queue
+    return SERVICE_QUEUE_PREFIX + service
+
+def reply_to_client(original_props, response_body, trace=None):
+    with build_connection() as conn_pub:
+        ch_pub = conn_pub.channel()
+        ch_pub.basic_publish(
+            exchange="",
+            routing_key=original_props.reply_to,
+            properties=pika.BasicProperties(
+                correlation_id=original_props.correlation_id,
+                headers=headers_for(trace),
+            ),
+            body=response_body,
+        )
+
+
+def handle_gateway_action(action: str, params: dict) -> dict:
+    if action == "metrics":
+        if params.get("format") == "prometheus":
+            return {"metrics": METRICS.to_prometheus()}
+        return {"metrics": METRICS.snapshot()}
+    if action == "services":
+        return {"services": REGISTRY.snapshot()}
+    return {"error": f"Ação '{action}' não reconhecida para gateway"}
+
+
+def forward_request_to_service(original_props, body: bytes, trace=None):
+    started = time.perf_counter()
+    service = action = None
+    service_label = action_label = UNKNOWN_LABEL
     try:
         payload = json.loads(body.decode())
         service = payload.get("service")
         action = payload.get("action")
         params = payload.get("params", {})
 
-        print(f"[gateway] Encaminhando para serviço '{service}' ação '{action}'")
+        REQUEST_LOG.debug("Encaminhando para serviço '%s' ação '%s'", service, action)
 
         if not service:
-            response_body = json.dumps({"error": "serviço não especificado"})
-            with build_connection() as conn_publish:
-                ch_pub = conn_publish.channel()
-                ch_pub.basic_publish(
-                    exchange="",
-                    routing_key=original_props.reply_to,
-                    properties=pika.BasicProperties(correlation_id=original_props.correlation_id),
-                    body=response_body,
-                )
+            reply_to_client(original_props, json.dumps({"error": "serviço não especificado"}))
+            METRICS.inc("errors_total", service="", action=UNKNOWN_LABEL, reason="bad_request")
             return
 
-        service_queue = SERVICE_QUEUE_PREFIX + service
+        if service == "gateway":
+            reply_to_client(original_props, json.dumps(handle_gateway_action(action, params)))
+            return
 
-        conn_service = build_connection()
-        ch_service = conn_service.channel()
+        service_label, action_label = REGISTRY.metric_labels(service, action)
+        service_queue = service_queue_for(service, action)
+        error = REGISTRY.check(service, service_queue, action)
+        if error:
+            reply_to_client(original_props, json.dumps({"error": error}))
+            METRICS.inc("errors_total", service=service_label, action=action_label, reason="unavailable")
+            return
 
-        callback_result = ch_service.queue_declare(queue="", exclusive=True)
-        callback_queue = callback_result.method.queue
+        METRICS.add_gauge("in_flight", 1, service=service_label)
+        try:
+            priority = priority_for(service, action, params, original_props.priority)
+            response_body, reply_trace = _call_service(service_queue, action, params, trace, priority)
+        except ServiceUnavailable as exc:
+            response_body, reply_trace = None, None
+            error = str(exc)
+        finally:
+            METRICS.add_gauge("in_flight", -1, service=service_label)
 
-        response_container = {"response": None}
-        corr_id = str(uuid.uuid4())
+        if error:
+            METRICS.inc("errors_total", service=service_label, action=action_label, reason="unroutable")
+            response_body = json.dumps({"error": error})
+        elif response_body is None:
+            METRICS.inc("timeouts_total", service=service_label, action=action_label)
+            response_body = json.dumps({"error": f"serviço '{service}' não respondeu (timeout)"})
+        else:
+            trace = reply_trace or trace
+            if response_body.startswith(b'{"error"'):
+                METRICS.inc("errors_total", service=service_label, action=action_label, reason="service")
 
-        def on_service_response(_ch, _method, props, body):
-            if props.correlation_id == corr_id:
-                response_container["response"] = body
-                _ch.basic_ack(delivery_tag=_method.delivery_tag)
+        stamp(trace, "gateway.reply")
+        reply_to_client(original_props, response_body, trace)
+        METRICS.inc("requests_total", service=service_label, action=action_label)
+        METRICS.observe("request_latency_ms", (time.perf_counter() - started) * 1000,
+                        service=service_label, action=action_label)
 
-        ch_service.basic_consume(queue=callback_queue, on_message_callback=on_service_response, auto_ack=False)
+    except Exception as exc:
+        LOG.exception("Falha ao encaminhar requisição", extra={"service": service, "action": action})
+        METRICS.inc("errors_total", service=service_label, action=action_label, reason="gateway")
+        try:
+            reply_to_client(original_props, json.dumps({"error": str(exc)}))
+        except Exception:
+            pass
+
+
+def _call_service(service_queue: str, action: str, params: dict, trace, priority: int):
+    conn_service = build_connection()
+    ch_service = conn_service.channel()
+    ch_service.confirm_delivery()
 
+    callback_result = ch_service.queue_declare(queue="", exclusive=True)
+    callback_queue = callback_result.method.queue
+
+    response_container = {"response": None, "trace": None}
+    corr_id = str(uuid.uuid4())
+
+    def on_service_response(_ch, _method, props, body):
+        if props.correlation_id == corr_id:
+            response_container["response"] = body
+            response_container["trace"] = from_properties(props)
+            _ch.basic_ack(delivery_tag=_method.delivery_tag)
+
+    ch_service.basic_consume(queue=callback_queue, on_message_callback=on_service_response, auto_ack=False)
+
+    stamp(trace, "gateway.forward")
+    try:
         ch_service.basic_publish(
             exchange="",
             routing_key=service_queue,
             properties=pika.BasicProperties(
                 reply_to=callback_queue,
                 correlation_id=corr_id,
+                priority=priority,
+                headers=headers_for(trace),
             ),
             body=json.dumps({"action": action, "params": params}),
+            mandatory=True,
         )
+    except pika.exceptions.UnroutableError:
+        conn_service.close()
+        raise ServiceUnavailable(f"fila '{service_queue}' não existe (serviço não iniciado)")
 
-        import time
-        timeout_seconds = 15
-        waited = 0.0
-        while response_container["response"] is None and waited < timeout_seconds:
-            conn_service.process_data_events(time_limit=1)
-            waited += 1
+    timeout_seconds = 15
+    waited = 0.0
+    while response_container["response"] is None and waited < timeout_seconds:
+        conn_service.process_data_events(time_limit=1)
+        waited += 1
 
-        conn_service.close()
+    conn_service.close()
 
-        if response_container["response"] is None:
-            response_body = json.dumps({"error": f"serviço '{service}' não respondeu (timeout)"})
-        else:
-            response_body = response_container["response"]
+    return response_container["response"], response_container["trace"]
 
-        conn_pub = build_connection()
-        ch_pub = conn_pub.channel()
-        ch_pub.basic_publish(
-            exchange="",
-            routing_key=original_props.reply_to,
-            properties=pika.BasicProperties(correlation_id=original_props.correlation_id),
-            body=response_body,
-        )
-        conn_pub.close()
 
-    except Exception as exc:
-        import traceback
-        traceback.print_exc()
-        try:
-            conn_pub = build_connection()
-            ch_pub = conn_pub.channel()
-            ch_pub.basic_publish(
-                exchange="",
-                routing_key=original_props.reply_to,
-                properties=pika.BasicProperties(correlation_id=original_props.correlation_id),
-                body=json.dumps({"error": str(exc)}),
-            )
-            conn_pub.close()
-        except Exception:
-            pass
+def forward_event_to_service(ch, body: bytes):
+    try:
+        payload = json.loads(body.decode())
+    except ValueError:
+        payload = None
+
+    service = payload.get("service") if isinstance(payload, dict) else None
+    if not service or not isinstance(service, str):
+        METRICS.inc("events_dropped_total", reason="bad_request")
+        return
+
+    ch.basic_publish(
+        exchange="",
+        routing_key=SERVICE_QUEUE_PREFIX + service + EVENTS_QUEUE_SUFFIX,
+        body=json.dumps({"action": payload.get("action"), "params": payload.get("params", {})}),
+        mandatory=True,
+    )
+
+
+def on_event_returned(_ch, method, _props, _body):
+    METRICS.inc("events_dropped_total", reason="unroutable")
+    REQUEST_LOG.debug("Evento sem fila de destino descartado", extra={"routing_key": method.routing_key})
 
 
 def on_gateway_request(ch, method, props, body):
-    print(f"[gateway] Requisição recebida corr_id={props.correlation_id}")
-    t = threading.Thread(target=forward_request_to_service, args=(props, body), daemon=True)
+    if RECORDER is not None:
+        RECORDER.record(body, bool(props.reply_to), props.priority)
+
+    if not props.reply_to:
+        try:
+            forward_event_to_service(ch, body)
+        except Exception:
+            LOG.exception("Falha ao repassar evento")
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+        return
+
+    trace = from_properties(props)
+    stamp(trace, "gateway.recv")
+    REQUEST_LOG.debug("Requisição recebida", extra={"corr_id": props.correlation_id})
+    t = threading.Thread(target=forward_request_to_service, args=(props, body, trace), daemon=True)
     t.start()
     ch.basic_ack(delivery_tag=method.delivery_tag)
 
 
-def main():
+def monitored_queues() -> list:
+    queues = [RPC_GATEWAY_QUEUE]
+    for service in MONITORED_SERVICES:
+        base = SERVICE_QUEUE_PREFIX + service
+        queues.extend([base, base + READ_QUEUE_SUFFIX, base + EVENTS_QUEUE_SUFFIX])
+    return queues
+
+
+def poll_queue_depths(conn):
+    ch = conn.channel()
+    for name in monitored_queues():
+        try:
+            result = ch.queue_declare(queue=name, passive=True)
+        except pika.exceptions.ChannelClosedByBroker:
+            ch = conn.channel()
+            continue
+        METRICS.set_gauge("queue_depth", result.method.message_count, queue=name)
+        METRICS.set_gauge("queue_consumers", result.method.consumer_count, queue=name)
+    ch.close()
+
+
+def run_metrics_poller():
+    while True:
+        try:
+            with build_connection() as conn:
+                while True:
+                    poll_queue_depths(conn)
+                    if METRICS_FILE:
+                        write_prometheus_file(METRICS, METRICS_FILE)
+                    conn.process_data_events(time_limit=METRICS_INTERVAL)
+        except pika.exceptions.AMQPError as exc:
+            LOG.warning("Falha ao coletar profundidade das filas: %s", exc)
+            time.sleep(METRICS_INTERVAL)
+
+
+def on_heartbeat(_ch, _method, _props, body):
+    try:
+        REGISTRY.observe(json.loads(body.decode()))
+    except ValueError as exc:
+        LOG.warning("Heartbeat inválido descartado: %s", str(exc))
+    except Exception:
+        LOG.exception("Falha ao registrar heartbeat")
+
+
+def run_registry_listener():
+    while True:
+        try:
+            with build_connection() as conn:
+                ch = conn.channel()
+                queue = subscribe_heartbeats(ch)
+                ch.basic_consume(queue=queue, on_message_callback=on_heartbeat, auto_ack=True)
+                ch.start_consuming()
+        except pika.exceptions.AMQPError as exc:
+            LOG.warning("Conexão do registro de serviços perdida: %s", exc)
+            time.sleep(1)
+        except Exception:
+            LOG.exception("Falha no listener do registro de serviços")
+            time.sleep(1)
+
+
+def run():
     connection: Optional[object] = None
     try:
         connection = build_connection()
         channel = configure_channel_for_consume(connection)
         declare_queue(channel, RPC_GATEWAY_QUEUE)
+        channel.add_on_return_callback(on_event_returned)
         channel.basic_consume(queue=RPC_GATEWAY_QUEUE, on_message_callback=on_gateway_request)
-        print(f"[gateway] Aguardando requisições na fila '{RPC_GATEWAY_QUEUE}' (CTRL+C para sair)")
-        signal.signal(signal.SIGINT, lambda *_: sys.exit(0))
+        threading.Thread(target=run_metrics_poller, daemon=True).start()
+        threading.Thread(target=run_registry_listener, daemon=True).start()
+        if METRICS_PORT:
+            serve_prometheus(METRICS, METRICS_PORT)
+            LOG.info("Métricas Prometheus em http://0.0.0.0:%d/metrics", METRICS_PORT)
+        if RECORDER is not None:
+            LOG.info("Gravando %.0f%% das requisições em '%s'", RECORDER.sample_rate * 100, RECORD_FILE)
+        LOG.info("Aguardando requisições na fila '%s' (CTRL+C para sair)", RPC_GATEWAY_QUEUE)
         channel.start_consuming()
     except KeyboardInterrupt:
-        print("\n[gateway] Encerrando...")
+        LOG.info("Encerrando...")
     finally:
         if connection and not connection.is_closed:
             connection.close()
 
 
+def main():
+    signal.signal(signal.SIGINT, lambda *_: sys.exit(0))
+    run()
+
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
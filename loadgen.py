@@ -0,0 +1,406 @@
+import json
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pika
+import tracing
+from messaging import build_connection, RPC_GATEWAY_QUEUE
+
+DIRECT_REPLY_TO = "amq.rabbitmq.reply-to"
+TIMEOUT_ERROR = "timeout esperando resposta"
+
+SEARCH_TERMS = ["rock", "love", "night", "blue", "dance", "queen", "river", "star"]
+ARTISTS = ["Queen", "The Beatles", "Radiohead", "Madonna", "Metallica"]
+
+DEFAULT_MIX = {
+    "users.play": 30,
+    "users.get_history": 15,
+    "users.most_played": 10,
+    "users.global_most_played": 5,
+    "users.recent_plays_all": 5,
+    "playlist.get": 10,
+    "playlist.list_user_playlists": 10,
+    "playlist.add_music": 5,
+    "catalog.search": 5,
+    "catalog.get_details": 5,
+}
+
+
+class BenchContext:
+    def __init__(self, users: int = 1000, tracks: int = 5000, seed: int = None):
+        self.rng = random.Random(seed)
+        self.users = users
+        self.tracks = tracks
+        self.playlist_ids = []
+        self.lock = threading.Lock()
+
+    def user_id(self) -> str:
+        return f"bench_user{self.rng.randrange(self.users)}"
+
+    def music_id(self) -> str:
+        return f"bench_m{int(self.rng.paretovariate(1.1)) % self.tracks:05d}"
+
+    def playlist_id(self):
+        with self.lock:
+            return self.rng.choice(self.playlist_ids) if self.playlist_ids else None
+
+
+def _params_for(action_key: str, ctx: BenchContext) -> dict:
+    if action_key == "users.play":
+        return {"user_id": ctx.user_id(), "music_id": ctx.music_id()}
+    if action_key == "users.play_batch":
+        return {"plays": [{"user_id": ctx.user_id(), "music_id": ctx.music_id()} for _ in range(200)]}
+    if action_key in ("users.get_history", "users.most_played", "users.get_stats",
+                      "users.recommend_for_user", "playlist.list_user_playlists"):
+        return {"user_id": ctx.user_id(), "limit": 10}
+    if action_key in ("users.global_most_played", "users.recent_plays_all"):
+        return {"limit": 10}
+    if action_key == "users.trending":
+        return {"window": ctx.rng.choice(["hour", "day", "week"]), "limit": 10}
+    if action_key in ("users.similar_tracks", "users.unique_listeners", "catalog.get_details"):
+        return {"music_id": ctx.music_id()}
+    if action_key == "playlist.get":
+        return {"playlist_id": ctx.playlist_id()}
+    if action_key == "playlist.add_music":
+        return {"playlist_id": ctx.playlist_id(), "music_ids": [ctx.music_id() for _ in range(3)]}
+    if action_key == "playlist.create":
+        return {"user_id": ctx.user_id(), "name": "bench", "description": ""}
+    if action_key == "catalog.search":
+        return {"query": ctx.rng.choice(SEARCH_TERMS), "limit": 5}
+    if action_key == "catalog.list_by_artist":
+        return {"artist": ctx.rng.choice(ARTISTS)}
+    return {}
+
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        key, _, weight = item.partition("=")
+        if "." not in key:
+            raise ValueError(f"ação '{key}' deve ter o formato serviço.ação")
+        mix[key] = float(weight) if weight else 1.0
+    if not mix:
+        raise ValueError("mix de ações vazio")
+    return mix
+
+
+class GatewayRpcClient:
+    def __init__(self, trace_sample_rate: float = None):
+        self.conn = build_connection()
+        self.ch = self.conn.channel()
+        self.trace_sample_rate = trace_sample_rate
+        self._pending = {}
+        self.ch.basic_consume(queue=DIRECT_REPLY_TO, on_message_callback=self._on_response, auto_ack=True)
+
+    def _on_response(self, _ch, _method, props, body):
+        if props.correlation_id in self._pending:
+            self._pending[props.correlation_id] = (body, props)
+
+    def call(self, service: str, action: str, params: dict, timeout: float = 20, priority: int = None) -> dict:
+        corr_id = str(uuid.uuid4())
+        self._pending[corr_id] = None
+        trace = tracing.start_trace(self.trace_sample_rate)
+        tracing.stamp(trace, "client.send")
+        self.ch.basic_publish(
+            exchange="",
+            routing_key=RPC_GATEWAY_QUEUE,
+            properties=pika.BasicProperties(reply_to=DIRECT_REPLY_TO, correlation_id=corr_id, priority=priority,
+                                            headers=tracing.headers_for(trace)),
+            body=json.dumps({"service": service, "action": action, "params": params}),
+        )
+
+        deadline = time.monotonic() + timeout
+        while self._pending[corr_id] is None and time.monotonic() < deadline:
+            self.conn.process_data_events(time_limit=min(0.05, max(deadline - time.monotonic(), 0)))
+
+        reply = self._pending.pop(corr_id)
+        if reply is None:
+            return {"error": TIMEOUT_ERROR}
+        body, props = reply
+        if trace is not None:
+            trace = tracing.from_properties(props) or trace
+            tracing.stamp(trace, "client.recv")
+        return tracing.attach(json.loads(body.decode()), trace)
+
+    def send_event(self, service: str, action: str, params: dict, priority: int = None):
+        self.ch.basic_publish(
+            exchange="",
+            routing_key=RPC_GATEWAY_QUEUE,
+            properties=pika.BasicProperties(priority=priority),
+            body=json.dumps({"service": service, "action": action, "params": params}),
+        )
+
+    def close(self):
+        if self.conn.is_open:
+            self.conn.close()
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(int(round(pct / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[idx]
+
+
+class BenchRecorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.timeouts = {}
+        self.traces = tracing.TraceAggregator()
+
+    def record(self, action_key: str, latency_ms: float, response: dict):
+        error = response.get("error") if isinstance(response, dict) else None
+        if isinstance(response, dict) and "_trace" in response:
+            service, action = action_key.split(".", 1)
+            self.traces.add(service, action, response.pop("_trace")["spans"])
+        with self.lock:
+            self.latencies.setdefault(action_key, []).append(latency_ms)
+            if error == TIMEOUT_ERROR:
+                self.timeouts[action_key] = self.timeouts.get(action_key, 0) + 1
+            elif error:
+                self.errors[action_key] = self.errors.get(action_key, 0) + 1
+
+    def summary(self, elapsed: float) -> dict:
+        actions = {}
+        all_latencies = []
+        total_errors = total_timeouts = 0
+
+        for key, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            all_latencies.extend(values)
+            errors = self.errors.get(key, 0)
+            timeouts = self.timeouts.get(key, 0)
+            total_errors += errors
+            total_timeouts += timeouts
+            actions[key] = _stats(values, errors, timeouts, elapsed)
+
+        all_latencies.sort()
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "total": _stats(all_latencies, total_errors, total_timeouts, elapsed),
+            "actions": actions,
+            "traces": self.traces.summary(),
+        }
+
+
+def _stats(values: list, errors: int, timeouts: int, elapsed: float) -> dict:
+    count = len(values)
+    return {
+        "count": count,
+        "throughput_rps": round(count / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(values, 50), 2),
+        "p95_ms": round(percentile(values, 95), 2),
+        "p99_ms": round(percentile(values, 99), 2),
+        "max_ms": round(values[-1], 2) if values else 0.0,
+        "error_rate": round(errors / count, 4) if count else 0.0,
+        "timeout_rate": round(timeouts / count, 4) if count else 0.0,
+    }
+
+
+def _prepare(ctx: BenchContext, mix: dict, timeout: float, playlists: int = 20):
+    if not any(key.startswith("playlist.") and key != "playlist.create" for key in mix):
+        return
+    client = GatewayRpcClient()
+    try:
+        for _ in range(playlists):
+            result = client.call("playlist", "create", _params_for("playlist.create", ctx), timeout)
+            if result.get("playlist_id"):
+                ctx.playlist_ids.append(result["playlist_id"])
+    finally:
+        client.close()
+
+
+def run_closed_loop(mix: dict, concurrency: int, duration: float, ctx: BenchContext,
+                    recorder: BenchRecorder, timeout: float, trace_sample_rate: float = None):
+    keys, weights = list(mix), list(mix.values())
+    deadline = time.monotonic() + duration
+
+    def worker():
+        client = GatewayRpcClient(trace_sample_rate)
+        try:
+            while time.monotonic() < deadline:
+                key = ctx.rng.choices(keys, weights)[0]
+                service, action = key.split(".", 1)
+                params = _params_for(key, ctx)
+                started = time.perf_counter()
+                response = client.call(service, action, params, timeout)
+                recorder.record(key, (time.perf_counter() - started) * 1000, response)
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def run_open_loop(mix: dict, rate: float, concurrency: int, duration: float, ctx: BenchContext,
+                  recorder: BenchRecorder, timeout: float, trace_sample_rate: float = None):
+    keys, weights = list(mix), list(mix.values())
+    local = threading.local()
+    clients = []
+    clients_lock = threading.Lock()
+
+    def send(key: str, intended: float):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = GatewayRpcClient(trace_sample_rate)
+            with clients_lock:
+                clients.append(client)
+        service, action = key.split(".", 1)
+        response = client.call(service, action, _params_for(key, ctx), timeout)
+        recorder.record(key, (time.perf_counter() - intended) * 1000, response)
+
+    interval = 1.0 / rate
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        n = 0
+        while True:
+            intended = start + n * interval
+            if intended - start >= duration:
+                break
+            delay = intended - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, ctx.rng.choices(keys, weights)[0], intended)
+            n += 1
+
+    for client in clients:
+        client.close()
+
+
+def run_bench(mix: dict = None, concurrency: int = 8, duration: float = 30, rate: float = None,
+              timeout: float = 20, seed: int = None, trace_sample_rate: float = None) -> dict:
+    mix = mix or DEFAULT_MIX
+    ctx = BenchContext(seed=seed)
+    recorder = BenchRecorder()
+    _prepare(ctx, mix, timeout)
+
+    started = time.perf_counter()
+    if rate:
+        run_open_loop(mix, rate, concurrency, duration, ctx, recorder, timeout, trace_sample_rate)
+    else:
+        run_closed_loop(mix, concurrency, duration, ctx, recorder, timeout, trace_sample_rate)
+    elapsed = time.perf_counter() - started
+
+    report = recorder.summary(elapsed)
+    report["config"] = {
+        "mode": "open" if rate else "closed",
+        "rate": rate,
+        "concurrency": concurrency,
+        "duration_s": duration,
+        "timeout_s": timeout,
+        "trace_sample_rate": tracing.TRACE_SAMPLE_RATE if trace_sample_rate is None else trace_sample_rate,
+        "mix": mix,
+    }
+    return report
+
+
+def run_replay(entries, speed: float, concurrency: int, recorder: BenchRecorder, timeout: float,
+               trace_sample_rate: float = None) -> dict:
+    local = threading.local()
+    clients = []
+    clients_lock = threading.Lock()
+    slots = threading.BoundedSemaphore(concurrency)
+    counts = {"requests": 0, "events": 0}
+
+    def send(entry: dict, intended):
+        try:
+            client = getattr(local, "client", None)
+            if client is None:
+                client = local.client = GatewayRpcClient(trace_sample_rate)
+                with clients_lock:
+                    clients.append(client)
+            service, action, params = entry["service"], entry["action"], entry.get("params", {})
+            if not entry.get("reply", True):
+                client.send_event(service, action, params, entry.get("priority"))
+                return
+            started = time.perf_counter() if intended is None else intended
+            response = client.call(service, action, params, timeout, entry.get("priority"))
+            recorder.record(f"{service}.{action}", (time.perf_counter() - started) * 1000, response)
+        finally:
+            slots.release()
+
+    start = time.perf_counter()
+    first_ts = None
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for entry in entries:
+            intended = None
+            if speed:
+                if first_ts is None:
+                    first_ts = entry["ts"]
+                intended = start + (entry["ts"] - first_ts) / speed
+                delay = intended - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            slots.acquire()
+            pool.submit(send, entry, intended)
+            counts["requests" if entry.get("reply", True) else "events"] += 1
+
+    for client in clients:
+        client.close()
+    return counts
+
+
+def compare_reports(before: dict, after: dict) -> dict:
+    def delta(old, new):
+        return round((new - old) / old, 4) if old else None
+
+    rows = {}
+    keys = sorted(set(before["actions"]) | set(after["actions"]))
+    for key, old, new in [(k, before["actions"].get(k), after["actions"].get(k)) for k in keys] + \
+            [("TOTAL", before["total"], after["total"])]:
+        if not old or not new:
+            rows[key] = {"before": old, "after": new}
+            continue
+        rows[key] = {
+            name: {"before": old[name], "after": new[name], "change": delta(old[name], new[name])}
+            for name in ("count", "throughput_rps", "p50_ms", "p99_ms", "error_rate", "timeout_rate")
+        }
+    return rows
+
+
+def print_comparison(comparison: dict):
+    header = f"{'ação':<32}{'rps antes':>11}{'depois':>9}{'p50 antes':>11}{'depois':>9}{'Δ':>10}" \
+             f"{'p99 antes':>11}{'depois':>9}{'Δ':>10}{'err% antes':>12}{'depois':>8}"
+    print(header)
+    print("-" * len(header))
+    for key, row in comparison.items():
+        if "p50_ms" not in row:
+            print(f"{key:<32}{'só antes' if row['before'] else 'só depois':>11}")
+            continue
+
+        def change(name):
+            value = row[name]["change"]
+            return f"{value * 100:>+9.1f}%" if value is not None else f"{'-':>10}"
+
+        print(f"{key:<32}{row['throughput_rps']['before']:>11.1f}{row['throughput_rps']['after']:>9.1f}"
+              f"{row['p50_ms']['before']:>11.1f}{row['p50_ms']['after']:>9.1f}{change('p50_ms')}"
+              f"{row['p99_ms']['before']:>11.1f}{row['p99_ms']['after']:>9.1f}{change('p99_ms')}"
+              f"{row['error_rate']['before'] * 100:>12.2f}{row['error_rate']['after'] * 100:>8.2f}")
+
+
+def print_report(report: dict):
+    header = f"{'ação':<32}{'n':>8}{'rps':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}{'err%':>8}{'tmo%':>8}"
+    print(header)
+    print("-" * len(header))
+    rows = list(report["actions"].items()) + [("TOTAL", report["total"])]
+    for key, s in rows:
+        print(f"{key:<32}{s['count']:>8}{s['throughput_rps']:>10.1f}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}"
+              f"{s['p99_ms']:>10.1f}{s['max_ms']:>10.1f}{s['error_rate'] * 100:>8.2f}{s['timeout_rate'] * 100:>8.2f}")
+
+    if report.get("traces"):
+        print("\nLatência por salto (média / máx em ms, amostras rastreadas):")
+        for key, spans in report["traces"].items():
+            print(f"  {key}")
+            for name, span in spans.items():
+                print(f"    {name:<40}{span['count']:>6}{span['mean_ms']:>10.2f}{span['max_ms']:>10.2f}")
@@ -0,0 +1,122 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import reprlib
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_SAMPLE = os.getenv("LOG_SAMPLE", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "200"))
+
+_RESERVED = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime"}
+_LISTENER = None
+
+
+def _parse_pairs(spec: str) -> dict:
+    pairs = {}
+    for item in spec.split(","):
+        name, _, value = item.strip().partition("=")
+        if name and value:
+            pairs[name] = value
+    return pairs
+
+
+def _make_repr() -> reprlib.Repr:
+    limited = reprlib.Repr()
+    limited.maxstring = LOG_MAX_FIELD_CHARS
+    limited.maxother = LOG_MAX_FIELD_CHARS
+    limited.maxlist = limited.maxtuple = limited.maxset = 10
+    limited.maxdict = 10
+    limited.maxlevel = 3
+    return limited
+
+
+_REPR = _make_repr()
+
+
+def truncate(value):
+    if isinstance(value, str):
+        if len(value) > LOG_MAX_FIELD_CHARS:
+            return value[:LOG_MAX_FIELD_CHARS] + f"...(+{len(value) - LOG_MAX_FIELD_CHARS})"
+        return value
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    return _REPR.repr(value)
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+# Formata no thread do listener: argumentos e campos extras são truncados com reprlib,
+# então listas enormes de params nunca são convertidas por completo em texto.
+class StructuredFormatter(logging.Formatter):
+    def __init__(self, style: str = "text"):
+        super().__init__()
+        self.style = style
+
+    def format(self, record: logging.LogRecord) -> str:
+        if record.args:
+            args = record.args if isinstance(record.args, tuple) else (record.args,)
+            record.msg = record.msg % tuple(truncate(arg) for arg in args)
+            record.args = None
+        message = record.getMessage()
+        fields = {key: truncate(value) for key, value in record.__dict__.items() if key not in _RESERVED}
+        timestamp = self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}"
+
+        if self.style == "json":
+            entry = {"ts": timestamp, "level": record.levelname, "logger": record.name, "msg": message}
+            entry.update(fields)
+            if record.exc_info:
+                entry["exc"] = self.formatException(record.exc_info)
+            return json.dumps(entry, ensure_ascii=False, default=str)
+
+        line = f"{timestamp} {record.levelname:<7} [{record.name}] {message}"
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class _DeferredQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup():
+    global _LISTENER
+    if _LISTENER is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(StructuredFormatter(LOG_FORMAT))
+    records = queue.SimpleQueue()
+    _LISTENER = QueueListener(records, output)
+    _LISTENER.start()
+    atexit.register(_LISTENER.stop)
+
+    root = logging.getLogger()
+    root.handlers = [_DeferredQueueHandler(records)]
+    root.setLevel(LOG_LEVEL)
+
+    for name, level in _parse_pairs(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level.upper())
+    for name, rate in _parse_pairs(LOG_SAMPLE).items():
+        logging.getLogger(name).addFilter(SamplingFilter(float(rate)))
+
+
+def get_logger(name: str) -> logging.Logger:
+    setup()
+    return logging.getLogger(name)
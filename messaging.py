@@ -1,9 +1,15 @@
 import os
+import json
+import time
+import uuid
 import pika
 from typing import Optional
 
 RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "localhost")
 RPC_GATEWAY_QUEUE = os.getenv("RABBITMQ_GATEWAY_QUEUE", "rpc_gateway")
+SIMULATED_LATENCY_SCALE = float(os.getenv("SIMULATED_LATENCY_SCALE", "1"))
+QUEUE_MAX_PRIORITY = int(os.getenv("RABBITMQ_MAX_PRIORITY", "10"))
+PRIORITY_CLASSES = {"bulk": 1, "normal": 5, "interactive": 9}
 
 def build_connection(host: str = RABBITMQ_HOST) -> pika.BlockingConnection:
     params = pika.ConnectionParameters(host=host)
@@ -14,8 +20,10 @@ def configure_channel_for_consume(connection: pika.BlockingConnection, prefetch_
     ch.basic_qos(prefetch_count=prefetch_count)
     return ch
 
-def declare_queue(channel: pika.channel.Channel, queue_name: str, durable: bool = False) -> str:
-    channel.queue_declare(queue=queue_name, durable=durable)
+def declare_queue(channel: pika.channel.Channel, queue_name: str, durable: bool = False,
+                  max_priority: int = QUEUE_MAX_PRIORITY) -> str:
+    arguments = {"x-max-priority": max_priority} if max_priority else None
+    channel.queue_declare(queue=queue_name, durable=durable, arguments=arguments)
     return queue_name
 
 def publish_message(channel: pika.channel.Channel, queue_name: str, message: str, 
@@ -25,4 +33,44 @@ def publish_message(channel: pika.channel.Channel, queue_name: str, message: str
         routing_key=queue_name,
         body=message,
         properties=properties or pika.BasicProperties()
-    )
\ No newline at end of file
+    )
+
+def declare_fanout_exchange(channel: pika.channel.Channel, exchange_name: str) -> str:
+    channel.exchange_declare(exchange=exchange_name, exchange_type="fanout")
+    return exchange_name
+
+def bind_exclusive_queue(channel: pika.channel.Channel, exchange_name: str) -> str:
+    result = channel.queue_declare(queue="", exclusive=True)
+    queue_name = result.method.queue
+    channel.queue_bind(exchange=exchange_name, queue=queue_name)
+    return queue_name
+
+def call_queue(queue_name: str, payload: dict, timeout: float = 15, priority: Optional[int] = None) -> dict:
+    conn = build_connection()
+    try:
+        ch = conn.channel()
+        callback_queue = ch.queue_declare(queue="", exclusive=True).method.queue
+        corr_id = str(uuid.uuid4())
+        response_container = {"response": None}
+
+        def on_response(_ch, _method, props, body):
+            if props.correlation_id == corr_id:
+                response_container["response"] = body
+
+        ch.basic_consume(queue=callback_queue, on_message_callback=on_response, auto_ack=True)
+        ch.basic_publish(
+            exchange="",
+            routing_key=queue_name,
+            properties=pika.BasicProperties(reply_to=callback_queue, correlation_id=corr_id, priority=priority),
+            body=json.dumps(payload),
+        )
+
+        deadline = time.monotonic() + timeout
+        while response_container["response"] is None and time.monotonic() < deadline:
+            conn.process_data_events(time_limit=min(1.0, max(deadline - time.monotonic(), 0)))
+    finally:
+        conn.close()
+
+    if response_container["response"] is None:
+        raise TimeoutError(f"sem resposta da fila '{queue_name}' em {timeout}s")
+    return json.loads(response_container["response"].decode())
@@ -0,0 +1,208 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+HISTOGRAM_BUCKETS = SUB_BUCKETS * 40
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+UNKNOWN_LABEL = "unknown"
+
+
+def _bucket_index(value_us: int) -> int:
+    if value_us < SUB_BUCKETS:
+        return value_us
+    shift = value_us.bit_length() - SUB_BUCKET_BITS - 1
+    return min((shift + 1) * SUB_BUCKETS + ((value_us >> shift) & (SUB_BUCKETS - 1)), HISTOGRAM_BUCKETS - 1)
+
+
+def _bucket_upper_us(index: int) -> int:
+    if index < SUB_BUCKETS:
+        return index
+    shift = index // SUB_BUCKETS - 1
+    return ((SUB_BUCKETS + index % SUB_BUCKETS + 1) << shift) - 1
+
+
+# Histograma log-linear no estilo HDR: 16 sub-faixas por potência de 2 (erro relativo < 7%),
+# memória fixa e registro O(1) independente do número de amostras.
+class LatencyHistogram:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = [0] * HISTOGRAM_BUCKETS
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, value_ms: float):
+        index = _bucket_index(int(value_ms * 1000))
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.total_ms += value_ms
+            if value_ms > self.max_ms:
+                self.max_ms = value_ms
+
+    def percentile(self, pct: float) -> float:
+        with self._lock:
+            counts = list(self._counts)
+            count = self.count
+        if not count:
+            return 0.0
+        target = max(int(pct / 100 * count + 0.5), 1)
+        seen = 0
+        for index, bucket in enumerate(counts):
+            seen += bucket
+            if seen >= target:
+                return min(_bucket_upper_us(index) / 1000, self.max_ms)
+        return self.max_ms
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50), 3),
+            "p90_ms": round(self.percentile(90), 3),
+            "p99_ms": round(self.percentile(99), 3),
+            "p999_ms": round(self.percentile(99.9), 3),
+            "max_ms": round(self.max_ms, 3),
+        }
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+# Valores vindos do cliente (ex.: ação) só viram label se forem conhecidos; o resto cai em
+# "unknown" para não criar uma série por valor arbitrário.
+def bounded_label(value, allowed) -> str:
+    return value if isinstance(value, str) and value in allowed else UNKNOWN_LABEL
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: tuple, extra: dict = None) -> str:
+    items = list(key) + sorted((extra or {}).items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in items) + "}"
+
+
+class MetricsRegistry:
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._collectors = []
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def add_gauge(self, name: str, delta: float, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name: str, value_ms: float, **labels):
+        key = (name, _label_key(labels))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, LatencyHistogram())
+        histogram.record(value_ms)
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def _collect(self):
+        for collector in self._collectors:
+            collector(self)
+
+    def snapshot(self) -> dict:
+        self._collect()
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = dict(self._histograms)
+
+        def grouped(items, convert):
+            result = {}
+            for (name, labels), value in sorted(items.items()):
+                result.setdefault(name, []).append(dict(labels, value=convert(value)))
+            return result
+
+        return {
+            "counters": grouped(counters, lambda v: v),
+            "gauges": grouped(gauges, lambda v: v),
+            "histograms": grouped(histograms, lambda h: h.summary()),
+        }
+
+    def to_prometheus(self) -> str:
+        self._collect()
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted(self._histograms.items())
+
+        lines = []
+        declared = set()
+
+        def declare(name, kind):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            metric = f"{self.prefix}_{name}"
+            declare(metric, "counter")
+            lines.append(f"{metric}{_format_labels(labels)} {value}")
+        for (name, labels), value in gauges:
+            metric = f"{self.prefix}_{name}"
+            declare(metric, "gauge")
+            lines.append(f"{metric}{_format_labels(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            metric = f"{self.prefix}_{name}"
+            declare(metric, "summary")
+            for q in QUANTILES:
+                lines.append(f"{metric}{_format_labels(labels, {'quantile': q})} {histogram.percentile(q * 100):.3f}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {histogram.total_ms:.3f}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def write_prometheus_file(registry: MetricsRegistry, path: str):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(registry.to_prometheus())
+    os.replace(tmp_path, path)
+
+
+def serve_prometheus(registry: MetricsRegistry, port: int, host: str = "0.0.0.0"):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.to_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
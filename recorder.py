@@ -0,0 +1,120 @@
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+from logs import get_logger
+
+RECORD_FILE = os.getenv("GATEWAY_RECORD_FILE", "")
+RECORD_SAMPLE = float(os.getenv("GATEWAY_RECORD_SAMPLE", "1"))
+RECORD_MAX_MB = float(os.getenv("GATEWAY_RECORD_MAX_MB", "64"))
+RECORD_BACKUPS = int(os.getenv("GATEWAY_RECORD_BACKUPS", "5"))
+RECORD_QUEUE_SIZE = 10000
+
+LOG = get_logger("recorder")
+
+
+# O thread do gateway só sorteia a amostra e enfileira (timestamp, corpo bruto); decodificar,
+# serializar e escrever ficam no thread de escrita. Com a fila cheia a requisição é descartada
+# da gravação em vez de atrasar o encaminhamento.
+class TrafficRecorder:
+    def __init__(self, path: str, sample_rate: float = RECORD_SAMPLE, max_bytes: int = None,
+                 backups: int = RECORD_BACKUPS):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.max_bytes = int(RECORD_MAX_MB * 1024 * 1024) if max_bytes is None else max_bytes
+        self.backups = backups
+        self.recorded = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=RECORD_QUEUE_SIZE)
+        self._file = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def record(self, body: bytes, reply: bool, priority=None):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        try:
+            self._queue.put_nowait((time.time(), body, reply, priority))
+        except queue.Full:
+            self.dropped += 1
+
+    def _line(self, ts: float, body: bytes, reply: bool, priority):
+        try:
+            payload = json.loads(body.decode())
+        except ValueError:
+            return None
+        if not isinstance(payload, dict):
+            return None
+        service = payload.get("service")
+        if not isinstance(service, str) or not service or service == "gateway":
+            return None
+        entry = {"ts": round(ts, 6), "service": service, "action": payload.get("action"),
+                 "params": payload.get("params", {}), "reply": reply}
+        if priority is not None:
+            entry["priority"] = priority
+        return json.dumps(entry, separators=(",", ":")) + "\n"
+
+    # O arquivo é reaberto mesmo se a rotação falhar no meio; se nem reabrir der certo, _run tenta
+    # de novo no próximo lote em vez de escrever num arquivo fechado.
+    def _rotate(self):
+        self._file.close()
+        try:
+            for index in range(self.backups - 1, 0, -1):
+                source = f"{self.path}.{index}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.path}.{index + 1}")
+            if self.backups:
+                os.replace(self.path, self.path + ".1")
+            else:
+                os.remove(self.path)
+        finally:
+            self._file = open(self.path, "a")
+
+    def _safe_line(self, item):
+        try:
+            return self._line(*item)
+        except Exception:
+            self.dropped += 1
+            LOG.debug("Requisição não gravada", exc_info=True)
+            return None
+
+    def _run(self):
+        self._file = open(self.path, "a")
+        while True:
+            item = self._queue.get()
+            lines = [self._safe_line(item)]
+            while len(lines) < 1000:
+                try:
+                    lines.append(self._safe_line(self._queue.get_nowait()))
+                except queue.Empty:
+                    break
+            lines = [line for line in lines if line]
+            if not lines:
+                continue
+            try:
+                if self._file.closed:
+                    self._file = open(self.path, "a")
+                self._file.writelines(lines)
+                self._file.flush()
+                self.recorded += len(lines)
+            except OSError:
+                self.dropped += len(lines)
+                LOG.exception("Falha ao gravar tráfego em '%s'", self.path)
+                continue
+            try:
+                if self.max_bytes and self._file.tell() >= self.max_bytes:
+                    self._rotate()
+            except Exception:
+                LOG.exception("Falha ao rotacionar '%s'", self.path)
+
+
+def read_recording(paths):
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
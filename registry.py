@@ -0,0 +1,159 @@
+import json
+import os
+import threading
+import time
+import uuid
+
+import pika.exceptions
+
+from logs import get_logger
+from messaging import build_connection, declare_fanout_exchange, bind_exclusive_queue
+from metrics import UNKNOWN_LABEL, bounded_label
+
+HEARTBEAT_EXCHANGE = "services.heartbeat"
+HEARTBEAT_INTERVAL = float(os.getenv("SERVICE_HEARTBEAT_INTERVAL", "2"))
+HEARTBEAT_TTL = float(os.getenv("SERVICE_HEARTBEAT_TTL", str(HEARTBEAT_INTERVAL * 3)))
+
+LOG = get_logger("registry")
+
+
+# O heartbeat roda em thread e conexão próprias: um handler mais lento que o TTL ocupa só a
+# conexão do serviço e não faz a instância parecer morta para o gateway.
+class Heartbeat:
+    def __init__(self, service: str, queue: str, actions, capacity: int = 1):
+        self.service = service
+        self.queue = queue
+        self.actions = sorted(actions)
+        self.capacity = capacity
+        self.instance = uuid.uuid4().hex[:12]
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _publish(self, channel, status: str):
+        channel.basic_publish(
+            exchange=HEARTBEAT_EXCHANGE,
+            routing_key="",
+            body=json.dumps({
+                "service": self.service,
+                "queue": self.queue,
+                "instance": self.instance,
+                "status": status,
+                "actions": self.actions,
+                "capacity": self.capacity,
+            }),
+        )
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{self.service}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            connection = None
+            try:
+                connection = build_connection()
+                self._beat(connection)
+            except pika.exceptions.AMQPError:
+                LOG.warning("Falha ao enviar heartbeat de '%s'; reconectando", self.queue, exc_info=True)
+                self._stopped.wait(HEARTBEAT_INTERVAL)
+            finally:
+                if connection is not None and connection.is_open:
+                    connection.close()
+
+    def _beat(self, connection):
+        channel = connection.channel()
+        declare_fanout_exchange(channel, HEARTBEAT_EXCHANGE)
+        while not self._stopped.is_set():
+            self._publish(channel, "up")
+            deadline = time.monotonic() + HEARTBEAT_INTERVAL
+            while not self._stopped.is_set() and time.monotonic() < deadline:
+                connection.sleep(min(0.2, max(deadline - time.monotonic(), 0)))
+        self._publish(channel, "down")
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=HEARTBEAT_INTERVAL)
+
+
+class ServiceRegistry:
+    def __init__(self, ttl: float = HEARTBEAT_TTL, grace: float = HEARTBEAT_TTL):
+        self.ttl = ttl
+        self.grace_until = time.monotonic() + grace
+        self._lock = threading.Lock()
+        self._instances = {}
+        self._services = set()
+        self._actions = {}
+
+    @staticmethod
+    def _validate(beat):
+        if not isinstance(beat, dict):
+            raise ValueError("heartbeat deve ser um objeto")
+        for field in ("service", "queue", "instance", "status"):
+            if not isinstance(beat.get(field), str) or not beat[field]:
+                raise ValueError(f"heartbeat sem '{field}' válido")
+        actions = beat.get("actions")
+        if not isinstance(actions, list) or not all(isinstance(action, str) for action in actions):
+            raise ValueError("'actions' do heartbeat deve ser uma lista de nomes")
+        capacity = beat.get("capacity", 1)
+        if isinstance(capacity, bool) or not isinstance(capacity, int) or capacity < 0:
+            raise ValueError("'capacity' do heartbeat deve ser um inteiro não negativo")
+
+    def observe(self, beat: dict):
+        self._validate(beat)
+        queue, instance = beat["queue"], beat["instance"]
+        with self._lock:
+            self._services.add(beat.get("service"))
+            self._actions.setdefault(beat.get("service"), set()).update(beat.get("actions", []))
+            instances = self._instances.setdefault(queue, {})
+            if beat.get("status") == "down":
+                instances.pop(instance, None)
+            else:
+                instances[instance] = (time.monotonic() + self.ttl, beat)
+
+    def live(self, queue: str) -> list:
+        now = time.monotonic()
+        with self._lock:
+            instances = self._instances.get(queue)
+            if not instances:
+                return []
+            for instance in [i for i, (expires, _) in instances.items() if expires <= now]:
+                del instances[instance]
+            return [beat for _, beat in instances.values()]
+
+    def check(self, service: str, queue: str, action: str):
+        live = self.live(queue)
+        if not live:
+            if time.monotonic() < self.grace_until:
+                return None
+            if service not in self._services:
+                return f"serviço '{service}' desconhecido"
+            return f"serviço '{service}' indisponível (nenhuma instância ativa)"
+        if not any(action in beat["actions"] for beat in live):
+            return f"ação '{action}' não suportada pelo serviço '{service}'"
+        return None
+
+    def metric_labels(self, service, action) -> tuple:
+        with self._lock:
+            actions = self._actions.get(service) if isinstance(service, str) else None
+        if actions is None:
+            return UNKNOWN_LABEL, UNKNOWN_LABEL
+        return service, bounded_label(action, actions)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            queues = list(self._instances)
+        result = {}
+        for queue in queues:
+            live = self.live(queue)
+            result[queue] = {
+                "instances": len(live),
+                "capacity": sum(beat.get("capacity", 1) for beat in live),
+                "actions": sorted({action for beat in live for action in beat["actions"]}),
+            }
+        return result
+
+
+def subscribe_heartbeats(channel) -> str:
+    exchange = declare_fanout_exchange(channel, HEARTBEAT_EXCHANGE)
+    return bind_exclusive_queue(channel, exchange)
@@ -0,0 +1,93 @@
+import argparse
+import itertools
+import json
+import sys
+import time
+
+import loadgen
+import tracing
+from recorder import read_recording
+
+
+def parse_speed(value: str) -> float:
+    if value == "max":
+        return 0.0
+    speed = float(value)
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("velocidade deve ser positiva ou 'max'")
+    return speed
+
+
+def replay(paths: list, speed: float, concurrency: int, timeout: float, limit: int = None,
+           trace_sample_rate: float = None) -> dict:
+    entries = read_recording(paths)
+    if limit:
+        entries = itertools.islice(entries, limit)
+
+    recorder = loadgen.BenchRecorder()
+    started = time.perf_counter()
+    counts = loadgen.run_replay(entries, speed, concurrency, recorder, timeout, trace_sample_rate)
+    elapsed = time.perf_counter() - started
+
+    report = recorder.summary(elapsed)
+    report["config"] = {
+        "mode": "replay",
+        "files": paths,
+        "speed": speed or "max",
+        "concurrency": concurrency,
+        "timeout_s": timeout,
+        "trace_sample_rate": tracing.TRACE_SAMPLE_RATE if trace_sample_rate is None else trace_sample_rate,
+        "requests": counts["requests"],
+        "events": counts["events"],
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduz tráfego gravado pelo gateway (GATEWAY_RECORD_FILE)")
+    parser.add_argument("files", nargs="*",
+                       help="Gravações JSON-lines, da mais antiga para a mais nova (ex.: trafego.jsonl.1 trafego.jsonl)")
+    parser.add_argument("--speed", type=parse_speed, default=1.0,
+                       help="Multiplicador de velocidade (1 = tempo real, 10 = 10×) ou 'max' (sem pausas)")
+    parser.add_argument("--concurrency", type=int, default=64,
+                       help="Máximo de requisições em andamento")
+    parser.add_argument("--timeout", type=float, default=20,
+                       help="Timeout por requisição em segundos")
+    parser.add_argument("--limit", type=int,
+                       help="Reproduzir apenas as N primeiras requisições")
+    parser.add_argument("--trace-sample", type=float,
+                       help="Fração das requisições com rastreamento de latência por salto")
+    parser.add_argument("--out", type=str,
+                       help="Arquivo JSON para gravar o resultado")
+    parser.add_argument("--compare", nargs=2, metavar=("ANTES", "DEPOIS"),
+                       help="Comparar dois resultados gravados com --out (ou client.py --bench-out)")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            before = json.load(f)
+        with open(args.compare[1]) as f:
+            after = json.load(f)
+        comparison = loadgen.compare_reports(before, after)
+        loadgen.print_comparison(comparison)
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(comparison, f, indent=2)
+        return
+
+    if not args.files:
+        parser.print_help()
+        sys.exit(1)
+
+    report = replay(args.files, args.speed, args.concurrency, args.timeout, args.limit, args.trace_sample)
+    loadgen.print_report(report)
+    print(f"\n{report['config']['requests']} requisições e {report['config']['events']} eventos "
+          f"reproduzidos em {report['elapsed_s']:.1f}s")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Resultado gravado em {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import json
+import os
+import time
+import uuid
+
+from logs import get_logger
+from messaging import declare_fanout_exchange, bind_exclusive_queue, call_queue, PRIORITY_CLASSES
+
+CHANGES_EXCHANGE_PREFIX = "changes."
+READ_QUEUE_SUFFIX = ".read"
+SNAPSHOT_PAGE_TIMEOUT = float(os.getenv("REPLICA_SNAPSHOT_PAGE_TIMEOUT", "60"))
+SNAPSHOT_RETRY_INTERVAL = float(os.getenv("REPLICA_SNAPSHOT_RETRY_INTERVAL", "5"))
+
+LOG = get_logger("replication")
+
+
+def now_ms() -> int:
+    return time.time_ns() // 1_000_000
+
+
+def changes_exchange(service: str) -> str:
+    return CHANGES_EXCHANGE_PREFIX + service
+
+
+class ChangePublisher:
+    def __init__(self, service: str):
+        self.exchange = changes_exchange(service)
+        self.epoch = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self.channel = None
+
+    def attach(self, channel):
+        declare_fanout_exchange(channel, self.exchange)
+        self.channel = channel
+
+    def publish(self, op: str, **data):
+        self.seq += 1
+        if self.channel is None:
+            return
+
+        event = {"epoch": self.epoch, "seq": self.seq, "ts": now_ms(), "op": op}
+        event.update(data)
+        self.channel.basic_publish(exchange=self.exchange, routing_key="", body=json.dumps(event))
+
+    def position(self) -> dict:
+        return {"epoch": self.epoch, "seq": self.seq}
+
+
+class ReplicaState:
+    def __init__(self):
+        self.epoch = None
+        self.applied_seq = 0
+        self.lag_ms = None
+        self.last_applied_at = None
+        self.gaps = 0
+        self.in_sync = False
+
+    def start_from(self, epoch: str, seq: int):
+        self.epoch = epoch
+        self.applied_seq = seq
+        self.in_sync = True
+        self.last_applied_at = now_ms()
+
+    # Troca de época (primário reiniciado) ou salto de sequência deixam a réplica fora de sincronia:
+    # nenhum evento é aplicado até um novo snapshot chamar start_from.
+    def accept(self, event: dict) -> bool:
+        epoch = event.get("epoch")
+        seq = event.get("seq", 0)
+
+        if not self.in_sync:
+            return False
+        if epoch != self.epoch or seq > self.applied_seq + 1:
+            self.gaps += 1
+            self.in_sync = False
+            return False
+        if seq <= self.applied_seq:
+            return False
+
+        self.applied_seq = seq
+        self.last_applied_at = now_ms()
+        self.lag_ms = self.last_applied_at - event.get("ts", self.last_applied_at)
+        return True
+
+    def status(self) -> dict:
+        return {
+            "role": "replica",
+            "in_sync": self.in_sync,
+            "epoch": self.epoch,
+            "applied_seq": self.applied_seq,
+            "lag_ms": self.lag_ms,
+            "last_applied_age_ms": now_ms() - self.last_applied_at if self.last_applied_at else None,
+            "gaps": self.gaps
+        }
+
+
+def subscribe_changes(channel, service: str) -> str:
+    exchange = declare_fanout_exchange(channel, changes_exchange(service))
+    return bind_exclusive_queue(channel, exchange)
+
+
+# O snapshot vem em páginas (`replication_snapshot` devolve o cursor da próxima em "next"), então
+# nenhuma mensagem carrega o estado inteiro e o primário volta a atender entre uma página e outra.
+# A posição vale a da primeira página; se o primário reiniciar no meio, o snapshot recomeça.
+def fetch_snapshot(queue_name: str) -> list:
+    pages = []
+    params = {}
+    while True:
+        page = call_queue(queue_name, {"action": "replication_snapshot", "params": params},
+                          timeout=SNAPSHOT_PAGE_TIMEOUT, priority=PRIORITY_CLASSES["normal"])
+        if "error" in page:
+            raise RuntimeError(page["error"])
+        if pages and page["position"]["epoch"] != pages[0]["position"]["epoch"]:
+            raise RuntimeError("primário reiniciou durante o snapshot")
+        pages.append(page)
+        if page.get("next") is None:
+            return pages
+        params = page["next"]
+
+
+# A réplica só passa a consumir e a anunciar heartbeat depois de carregar o snapshot; enquanto o
+# primário não responde ela tenta de novo em vez de subir vazia.
+def wait_for_snapshot(connection, queue_name: str, load):
+    while True:
+        try:
+            pages = fetch_snapshot(queue_name)
+        except (TimeoutError, RuntimeError) as e:
+            LOG.warning("Snapshot de '%s' indisponível (%s); nova tentativa em %.1fs",
+                        queue_name, str(e), SNAPSHOT_RETRY_INTERVAL)
+            connection.sleep(SNAPSHOT_RETRY_INTERVAL)
+            continue
+        load(pages)
+        return
@@ -0,0 +1,69 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def expires_in(self, key) -> float:
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry[0] - time.monotonic() if entry else 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self):
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+
+    def try_take(self, reserve: float = 0) -> bool:
+        with self._lock:
+            self._refill()
+            if self._tokens - 1 < reserve:
+                return False
+            self._tokens -= 1
+            return True
+
+    def wait_time(self, reserve: float = 0) -> float:
+        with self._lock:
+            self._refill()
+            return max(reserve + 1 - self._tokens, 0) / self.rate
@@ -0,0 +1,122 @@
+import base64
+
+import numpy as np
+
+DTYPES = {"f8": "<f8", "f4": "<f4", "i8": "<i8", "i4": "<i4", "u4": "<u4", "u2": "<u2"}
+DEFAULT_PERCENTILES = (50, 90, 99)
+DEFAULT_BINS = 10
+
+
+def encode_values(values, dtype: str = "f8") -> str:
+    return base64.b64encode(np.asarray(values, dtype=DTYPES[dtype]).tobytes()).decode()
+
+
+def decode_values(params: dict) -> np.ndarray:
+    if "data" in params:
+        dtype = params.get("dtype", "f8")
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype '{dtype}' não suportado ({', '.join(DTYPES)})")
+        raw = base64.b64decode(params["data"])
+        if len(raw) % np.dtype(DTYPES[dtype]).itemsize:
+            raise ValueError(f"tamanho de 'data' não é múltiplo de {dtype}")
+        values = np.frombuffer(raw, dtype=DTYPES[dtype])
+    else:
+        values = np.asarray(params.get("numbers", []), dtype=np.float64)
+        if values.ndim != 1:
+            raise ValueError("'numbers' deve ser uma lista de números")
+    return values.astype(np.float64, copy=False)
+
+
+def _check(values: np.ndarray):
+    if not values.size:
+        raise ValueError("lista vazia")
+    if not np.isfinite(values).all():
+        raise ValueError("valores não finitos (NaN/inf) não são aceitos")
+
+
+def mean(values: np.ndarray) -> float:
+    _check(values)
+    return float(values.mean())
+
+
+def _percentiles(ordered: np.ndarray, percentiles) -> np.ndarray:
+    ranks = np.asarray(percentiles, dtype=np.float64)
+    if ((ranks < 0) | (ranks > 100)).any():
+        raise ValueError("percentis devem estar entre 0 e 100")
+    positions = ranks / 100 * (ordered.size - 1)
+    below = np.floor(positions).astype(np.intp)
+    above = np.minimum(below + 1, ordered.size - 1)
+    return ordered[below] + (positions - below) * (ordered[above] - ordered[below])
+
+
+def _histogram(ordered: np.ndarray, bins: int, value_range=None):
+    low, high = value_range or (ordered[0], ordered[-1])
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+    edges = np.linspace(low, high, int(bins) + 1)
+    positions = np.searchsorted(ordered, edges, side="left")
+    positions[-1] = np.searchsorted(ordered, high, side="right")
+    return np.diff(positions), edges
+
+
+# Uma ordenação atende mínimo, máximo, percentis e histograma (busca binária das bordas);
+# média e variância saem de duas reduções vetorizadas sobre o mesmo array.
+def describe(values: np.ndarray, percentiles=DEFAULT_PERCENTILES, bins: int = DEFAULT_BINS,
+             value_range=None) -> dict:
+    _check(values)
+    ordered = np.sort(values)
+    total = float(ordered.sum())
+    mean = total / ordered.size
+    deviations = ordered - mean
+    variance = float(np.dot(deviations, deviations) / ordered.size)
+    quantiles = _percentiles(ordered, percentiles)
+    counts, edges = _histogram(ordered, bins, value_range)
+    return {
+        "count": int(ordered.size),
+        "sum": total,
+        "mean": mean,
+        "variance": variance,
+        "stddev": variance ** 0.5,
+        "min": float(ordered[0]),
+        "max": float(ordered[-1]),
+        "percentiles": {str(p): float(q) for p, q in zip(percentiles, quantiles)},
+        "histogram": {"edges": edges.tolist(), "counts": counts.tolist()},
+    }
+
+
+def group_stats(keys, values: np.ndarray) -> list:
+    _check(values)
+    keys = np.asarray(keys)
+    if keys.shape != values.shape:
+        raise ValueError("'keys' e os valores devem ter o mesmo tamanho")
+    groups, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse, minlength=groups.size)
+    sums = np.bincount(inverse, weights=values, minlength=groups.size)
+    minimums = np.full(groups.size, np.inf)
+    maximums = np.full(groups.size, -np.inf)
+    np.minimum.at(minimums, inverse, values)
+    np.maximum.at(maximums, inverse, values)
+    return [
+        {"key": key, "count": int(count), "sum": float(total), "mean": float(total / count),
+         "min": float(low), "max": float(high)}
+        for key, count, total, low, high in zip(groups.tolist(), counts, sums, minimums, maximums)
+    ]
+
+
+class Accumulator:
+    def __init__(self, max_values: int):
+        self.max_values = max_values
+        self.count = 0
+        self._chunks = []
+
+    def append(self, values: np.ndarray):
+        _check(values)
+        if self.count + values.size > self.max_values:
+            raise ValueError(f"sessão excede o limite de {self.max_values} valores")
+        self._chunks.append(values)
+        self.count += values.size
+
+    def values(self) -> np.ndarray:
+        if len(self._chunks) > 1:
+            self._chunks = [np.concatenate(self._chunks)]
+        return self._chunks[0] if self._chunks else np.empty(0)
@@ -0,0 +1,165 @@
+import time
+from array import array
+from datetime import datetime
+
+SEGMENT_SIZE = 1 << 16
+
+
+def now_ms() -> int:
+    return time.time_ns() // 1_000_000
+
+
+def ms_to_iso(timestamp_ms: int) -> str:
+    return datetime.fromtimestamp(timestamp_ms / 1000).isoformat(timespec="milliseconds")
+
+
+class IdInterner:
+    def __init__(self):
+        self._ids = {}
+        self._names = []
+
+    def intern(self, name: str) -> int:
+        idx = self._ids.get(name)
+        if idx is None:
+            idx = len(self._names)
+            self._ids[name] = idx
+            self._names.append(name)
+        return idx
+
+    def assign(self, name: str, idx: int):
+        if idx >= len(self._names):
+            self._names.extend([None] * (idx + 1 - len(self._names)))
+        self._names[idx] = name
+        self._ids[name] = idx
+
+    def lookup(self, name: str):
+        return self._ids.get(name)
+
+    def name(self, idx: int) -> str:
+        return self._names[idx]
+
+    def names(self, start: int = 0, stop: int = None) -> list:
+        return self._names[start:stop]
+
+    def __len__(self):
+        return len(self._names)
+
+
+class PlayLog:
+    def __init__(self, segment_size: int = SEGMENT_SIZE):
+        self.segment_size = segment_size
+        self.users = IdInterner()
+        self.tracks = IdInterner()
+        self._user_cols = []
+        self._track_cols = []
+        self._ts_cols = []
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _new_segment(self):
+        self._user_cols.append(array("I"))
+        self._track_cols.append(array("I"))
+        self._ts_cols.append(array("q"))
+
+    def append_ids(self, uid: int, tid: int, timestamp_ms: int) -> int:
+        if self._size % self.segment_size == 0:
+            self._new_segment()
+
+        columns = (self._user_cols[-1], self._track_cols[-1], self._ts_cols[-1])
+        try:
+            for column, value in zip(columns, (uid, tid, timestamp_ms)):
+                column.append(value)
+        except (TypeError, OverflowError):
+            offset = self._size % self.segment_size
+            for column in columns:
+                del column[offset:]
+            if not offset:
+                for cols in (self._user_cols, self._track_cols, self._ts_cols):
+                    cols.pop()
+            raise
+
+        row = self._size
+        self._size += 1
+        return row
+
+    def extend_ids(self, users, tracks, timestamps) -> int:
+        first_row = self._size
+        pos = 0
+
+        while pos < len(users):
+            if self._size % self.segment_size == 0:
+                self._new_segment()
+
+            take = min(self.segment_size - self._size % self.segment_size, len(users) - pos)
+            self._user_cols[-1].extend(users[pos:pos + take])
+            self._track_cols[-1].extend(tracks[pos:pos + take])
+            self._ts_cols[-1].extend(timestamps[pos:pos + take])
+            self._size += take
+            pos += take
+
+        return first_row
+
+    def append(self, user_id: str, music_id: str, timestamp_ms: int) -> int:
+        return self.append_ids(self.users.intern(user_id), self.tracks.intern(music_id), timestamp_ms)
+
+    def row(self, row: int):
+        seg, offset = divmod(row, self.segment_size)
+        return self._user_cols[seg][offset], self._track_cols[seg][offset], self._ts_cols[seg][offset]
+
+    def record(self, row: int) -> dict:
+        uid, tid, timestamp_ms = self.row(row)
+        return {
+            "user_id": self.users.name(uid),
+            "music_id": self.tracks.name(tid),
+            "played_at": ms_to_iso(timestamp_ms)
+        }
+
+    def export_columns(self, start: int = 0, stop: int = None):
+        stop = self._size if stop is None else min(stop, self._size)
+        parts = ([], [], [])
+        pos = start
+
+        while pos < stop:
+            segment, offset = divmod(pos, self.segment_size)
+            take = min(self.segment_size - offset, stop - pos)
+            for part, cols in zip(parts, (self._user_cols, self._track_cols, self._ts_cols)):
+                part.append(cols[segment][offset:offset + take].tobytes())
+            pos += take
+
+        return tuple(b"".join(part) for part in parts)
+
+    def nbytes(self) -> int:
+        total = 0
+        for cols in (self._user_cols, self._track_cols, self._ts_cols):
+            total += sum(col.buffer_info()[1] * col.itemsize for col in cols)
+        return total
+
+
+class RecentPlaysRing:
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self._slots = [None] * capacity
+        self._written = 0
+
+    def push(self, uid: int, tid: int, timestamp_ms: int):
+        seq = self._written
+        self._slots[seq % self.capacity] = (seq, uid, tid, timestamp_ms)
+        self._written = seq + 1
+
+    def latest(self, limit: int):
+        written = self._written
+        oldest = max(written - min(limit, self.capacity), 0)
+        result = []
+
+        for seq in range(written - 1, oldest - 1, -1):
+            slot = self._slots[seq % self.capacity]
+            if slot is None or slot[0] != seq:
+                break
+            result.append(slot[1:])
+
+        return result
+
+    def __len__(self):
+        return min(self._written, self.capacity)
@@ -0,0 +1,213 @@
+import heapq
+import math
+from collections import Counter
+
+import numpy as np
+
+SESSION_GAP_MS = 30 * 60 * 1000
+SESSION_WINDOW = 50
+NEIGHBORS = 20
+NO_SESSION = np.iinfo(np.int64).min // 2
+BLOCK_PLAYS = 65536
+
+
+# A sessão de um usuário é a sequência de reproduções, em ordem de chegada, sem intervalo maior que
+# session_gap_ms; cada reprodução coocorre com as músicas distintas das session_window anteriores e
+# é ignorada se a própria música estiver entre elas. O estado da sessão fica em arrays por usuário
+# para que add (ao vivo) e add_block (reconstrução vetorizada) produzam exatamente o mesmo índice.
+class CoOccurrenceIndex:
+    def __init__(self, session_gap_ms: int = SESSION_GAP_MS, session_window: int = SESSION_WINDOW,
+                 neighbors: int = NEIGHBORS):
+        self.session_gap_ms = session_gap_ms
+        self.session_window = session_window
+        self.neighbors = neighbors
+        self._session_ts = np.full(0, NO_SESSION, dtype=np.int64)
+        self._session_len = np.zeros(0, dtype=np.int32)
+        self._session_items = np.zeros((0, session_window), dtype=np.uint32)
+        self._matrix = {}
+        self._item_counts = Counter()
+        self._neighbors = {}
+        self._dirty = set()
+
+    def _reserve(self, users: int):
+        size = len(self._session_ts)
+        if users <= size:
+            return
+        grow = max(users, size * 2, 1024) - size
+        self._session_ts = np.concatenate([self._session_ts, np.full(grow, NO_SESSION, dtype=np.int64)])
+        self._session_len = np.concatenate([self._session_len, np.zeros(grow, dtype=np.int32)])
+        self._session_items = np.concatenate(
+            [self._session_items, np.zeros((grow, self.session_window), dtype=np.uint32)])
+
+    def _add_pairs(self, heads, tails, counts):
+        matrix = self._matrix
+        for head, tail, count in zip(heads, tails, counts):
+            row = matrix.get(head)
+            if row is None:
+                row = matrix[head] = Counter()
+            row[tail] += count
+        self._dirty.update(heads)
+
+    def add(self, uid: int, tid: int, timestamp_ms: int):
+        self._reserve(uid + 1)
+        length = int(self._session_len[uid])
+        if timestamp_ms - int(self._session_ts[uid]) > self.session_gap_ms:
+            length = 0
+        self._session_ts[uid] = timestamp_ms
+
+        items = self._session_items[uid]
+        window = set(items[:length].tolist())
+        if length == self.session_window:
+            items[:-1] = items[1:]
+            items[-1] = tid
+        else:
+            items[length] = tid
+            length += 1
+        self._session_len[uid] = length
+
+        if tid in window:
+            return
+        self._item_counts[tid] += 1
+        if window:
+            others = list(window)
+            self._add_pairs([tid] * len(others) + others, others + [tid] * len(others), [1] * (2 * len(others)))
+
+    def _merge_pairs(self, keys, counts):
+        low, high = keys >> 32, keys & 0xFFFFFFFF
+        keys = np.concatenate([keys, high << 32 | low])
+        order = np.argsort(keys)
+        keys, counts = keys[order], np.concatenate([counts, counts])[order]
+        heads = keys >> 32
+        bounds = (np.flatnonzero(heads[1:] != heads[:-1]) + 1).tolist()
+        tails, counts = (keys & 0xFFFFFFFF).tolist(), counts.tolist()
+
+        matrix = self._matrix
+        for head, start, end in zip(heads[[0] + bounds].tolist(), [0] + bounds, bounds + [len(tails)]):
+            row = matrix.get(head)
+            if row is None:
+                matrix[head] = Counter(dict(zip(tails[start:end], counts[start:end])))
+            else:
+                for tail, count in zip(tails[start:end], counts[start:end]):
+                    row[tail] += count
+            self._dirty.add(head)
+
+    # Reproduções em ordem de chegada, em fatias de BLOCK_PLAYS para limitar a memória dos pares; os
+    # pares de todas as fatias são somados antes de tocar a matriz.
+    def add_block(self, uids, tids, timestamps):
+        keys, counts = [], []
+        for start in range(0, len(uids), BLOCK_PLAYS):
+            end = start + BLOCK_PLAYS
+            pairs = self._add_slice(uids[start:end], tids[start:end], timestamps[start:end])
+            if pairs is not None:
+                keys.append(pairs[0])
+                counts.append(pairs[1])
+        if not keys:
+            return
+        if len(keys) > 1:
+            keys, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+            counts = np.bincount(inverse, weights=np.concatenate(counts)).astype(np.int64)
+        else:
+            keys, counts = keys[0], counts[0]
+        self._merge_pairs(keys, counts)
+
+    # As sessões em aberto entram na frente de cada usuário como elementos "herdados" (só contam
+    # como janela); cada reprodução aceita gera um par com cada elemento das session_window posições
+    # anteriores da mesma sessão que seja a ocorrência mais recente da sua música, e os pares da
+    # fatia são somados com np.unique pela chave (menor, maior).
+    def _add_slice(self, uids, tids, timestamps):
+        window_size = self.session_window
+        self._reserve(int(uids.max()) + 1)
+
+        order = np.argsort(uids, kind="stable")
+        uids, tids, timestamps = uids[order], tids[order], timestamps[order]
+        users, starts = np.unique(uids, return_index=True)
+        ends = np.append(starts[1:], len(uids))
+
+        inherited = np.where(timestamps[starts] - self._session_ts[users] > self.session_gap_ms,
+                             0, self._session_len[users])
+        shift = np.cumsum(inherited)
+        total = len(uids) + int(shift[-1])
+        real = np.zeros(total, dtype=bool)
+        real[np.arange(len(uids)) + np.repeat(shift, ends - starts)] = True
+        items = np.empty(total, dtype=np.uint32)
+        stamps = np.empty(total, dtype=np.int64)
+        items[real] = tids
+        stamps[real] = timestamps
+        items[~real] = self._session_items[users][np.arange(window_size) < inherited[:, None]]
+        stamps[~real] = np.repeat(self._session_ts[users], inherited)
+
+        breaks = np.empty(total, dtype=bool)
+        breaks[0] = True
+        breaks[1:] = stamps[1:] - stamps[:-1] > self.session_gap_ms
+        breaks[starts + shift - inherited] = True
+        session = np.cumsum(breaks) - 1
+        position = np.arange(total) - np.flatnonzero(breaks)[session]
+
+        by_item = np.argsort(session.astype(np.int64) << 32 | items, kind="stable")
+        repeated = ((session[by_item[1:]] == session[by_item[:-1]])
+                    & (items[by_item[1:]] == items[by_item[:-1]]))
+        earlier, later = by_item[:-1][repeated], by_item[1:][repeated]
+        to_next = np.full(total, window_size + 1, dtype=np.int64)
+        to_next[earlier] = later - earlier
+        to_prev = np.full(total, window_size + 1, dtype=np.int64)
+        to_prev[later] = later - earlier
+
+        accepted = real & (to_prev > window_size)
+        distinct, counts = np.unique(items[accepted], return_counts=True)
+        self._item_counts.update(dict(zip(distinct.tolist(), counts.tolist())))
+
+        pairs = []
+        candidates = np.flatnonzero(accepted & (position > 0))
+        for distance in range(1, window_size + 1):
+            candidates = candidates[position[candidates] >= distance]
+            if not len(candidates):
+                break
+            paired = candidates[to_next[candidates - distance] >= distance]
+            heads, tails = items[paired], items[paired - distance]
+            pairs.append(np.minimum(heads, tails).astype(np.int64) << 32 | np.maximum(heads, tails))
+
+        last = ends + shift - 1
+        length = np.minimum(position[last] + 1, window_size)
+        kept = np.minimum(last[:, None] - length[:, None] + 1 + np.arange(window_size), last[:, None])
+        self._session_items[users] = items[kept]
+        self._session_len[users] = length
+        self._session_ts[users] = stamps[last]
+
+        if pairs:
+            return np.unique(np.concatenate(pairs), return_counts=True)
+        return None
+
+    def _compute_neighbors(self, tid: int):
+        row = self._matrix.get(tid)
+        if not row:
+            return []
+
+        item_count = self._item_counts[tid]
+        counts = self._item_counts
+        scored = (
+            (co / math.sqrt(item_count * counts[other]), other)
+            for other, co in row.items()
+        )
+        return [(other, score) for score, other in heapq.nlargest(self.neighbors, scored)]
+
+    def refresh(self):
+        for tid in self._dirty:
+            self._neighbors[tid] = self._compute_neighbors(tid)
+        self._dirty.clear()
+
+    def similar(self, tid: int, limit: int = 10):
+        if tid in self._dirty:
+            self._neighbors[tid] = self._compute_neighbors(tid)
+            self._dirty.discard(tid)
+        return self._neighbors.get(tid, [])[:limit]
+
+    def recommend(self, seeds, exclude, limit: int = 10):
+        scores = Counter()
+        for seed, weight in seeds:
+            for other, score in self.similar(seed, self.neighbors):
+                if other not in exclude:
+                    scores[other] += weight * score
+        return scores.most_common(limit)
+
+    def pair_count(self) -> int:
+        return sum(len(row) for row in self._matrix.values())
@@ -0,0 +1,184 @@
+import mmap
+import os
+import struct
+import zlib
+from array import array
+
+SEGMENT_MAGIC = b"MQPL\x01"
+SEGMENT_SUFFIX = ".seg"
+FRAME_HEADER = struct.Struct("<cII")
+DEFINITION = struct.Struct("<I")
+PLAY_COUNT = struct.Struct("<I")
+PLAY_RECORD_BYTES = 4 + 4 + 8
+MAX_FRAME_PLAYS = 8192
+
+FRAME_USER = b"U"
+FRAME_TRACK = b"T"
+FRAME_PLAYS = b"P"
+
+
+def _empty_batch():
+    return [array("I"), array("I"), array("q")]
+
+
+class SegmentStore:
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024,
+                 max_segments: int = 32, fsync: bool = False):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.fsync = fsync
+        self._file = None
+        self._offset = 0
+        self._seq = 0
+        self._defined_users = set()
+        self._defined_tracks = set()
+        os.makedirs(directory, exist_ok=True)
+
+    def _segments(self):
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith(SEGMENT_SUFFIX))
+        return [os.path.join(self.directory, n) for n in names]
+
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{seq:010d}{SEGMENT_SUFFIX}")
+
+    # Frames de reproduções consecutivos são entregues em lotes de até batch_rows linhas.
+    # O último segmento é reaberto e continua do fim do último frame válido; sem isso cada
+    # reinício abriria um segmento novo e a retenção por contagem apagaria histórico.
+    def replay(self, log, on_rows, batch_rows: int = MAX_FRAME_PLAYS):
+        segments = self._segments()
+        resume = None
+        batch = _empty_batch()
+
+        for path in segments:
+            resume = None
+            with open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size <= len(SEGMENT_MAGIC):
+                    continue
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    if mm[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+                        continue
+                    resume = (path,) + self._replay_segment(mm, log, on_rows, batch, batch_rows)
+
+        if batch[0]:
+            on_rows(*batch)
+        if segments:
+            self._seq = int(os.path.basename(segments[-1])[:-len(SEGMENT_SUFFIX)]) + 1
+        if resume:
+            self._resume(*resume)
+
+    def _resume(self, path: str, offset: int, users: set, tracks: set):
+        if offset >= self.segment_bytes:
+            return
+        self._file = open(path, "r+b")
+        self._file.truncate(offset)
+        self._file.truncate(self.segment_bytes)
+        self._offset = offset
+        self._defined_users = users
+        self._defined_tracks = tracks
+
+    def _replay_segment(self, mm, log, on_rows, batch: list, batch_rows: int):
+        offset = len(SEGMENT_MAGIC)
+        end = len(mm)
+        users_defined, tracks_defined = set(), set()
+
+        while offset + FRAME_HEADER.size <= end:
+            kind, length, checksum = FRAME_HEADER.unpack_from(mm, offset)
+            start = offset + FRAME_HEADER.size
+            if kind == b"\0" or start + length > end:
+                break
+
+            payload = mm[start:start + length]
+            if zlib.crc32(payload) != checksum:
+                break
+            offset = start + length
+
+            if kind == FRAME_USER:
+                (idx,) = DEFINITION.unpack_from(payload)
+                log.users.assign(payload[DEFINITION.size:].decode(), idx)
+                users_defined.add(idx)
+            elif kind == FRAME_TRACK:
+                (idx,) = DEFINITION.unpack_from(payload)
+                log.tracks.assign(payload[DEFINITION.size:].decode(), idx)
+                tracks_defined.add(idx)
+            elif kind == FRAME_PLAYS:
+                (count,) = PLAY_COUNT.unpack_from(payload)
+                users, tracks, timestamps = batch
+                pos = PLAY_COUNT.size
+                users.frombytes(payload[pos:pos + 4 * count])
+                pos += 4 * count
+                tracks.frombytes(payload[pos:pos + 4 * count])
+                pos += 4 * count
+                timestamps.frombytes(payload[pos:pos + 8 * count])
+                if len(users) >= batch_rows:
+                    on_rows(users, tracks, timestamps)
+                    batch[:] = _empty_batch()
+
+        return offset, users_defined, tracks_defined
+
+    def _rotate(self):
+        if self._file:
+            self._file.close()
+
+        path = self._segment_path(self._seq)
+        self._seq += 1
+        self._file = open(path, "w+b")
+        self._file.truncate(self.segment_bytes)
+        self._file.write(SEGMENT_MAGIC)
+        self._offset = len(SEGMENT_MAGIC)
+        self._defined_users = set()
+        self._defined_tracks = set()
+
+        segments = self._segments()
+        for old in segments[:max(len(segments) - self.max_segments, 0)]:
+            os.remove(old)
+
+    @staticmethod
+    def _frame(kind: bytes, payload: bytes) -> bytes:
+        return FRAME_HEADER.pack(kind, len(payload), zlib.crc32(payload)) + payload
+
+    def _chunk_frames(self, log, rows):
+        frames = []
+        users, tracks, timestamps = array("I"), array("I"), array("q")
+
+        for uid, tid, timestamp_ms in rows:
+            if uid not in self._defined_users:
+                self._defined_users.add(uid)
+                frames.append(self._frame(FRAME_USER, DEFINITION.pack(uid) + log.users.name(uid).encode()))
+            if tid not in self._defined_tracks:
+                self._defined_tracks.add(tid)
+                frames.append(self._frame(FRAME_TRACK, DEFINITION.pack(tid) + log.tracks.name(tid).encode()))
+            users.append(uid)
+            tracks.append(tid)
+            timestamps.append(timestamp_ms)
+
+        payload = PLAY_COUNT.pack(len(users)) + users.tobytes() + tracks.tobytes() + timestamps.tobytes()
+        frames.append(self._frame(FRAME_PLAYS, payload))
+        return b"".join(frames)
+
+    def append(self, log, rows: list):
+        if self._file is None:
+            self._rotate()
+
+        for start in range(0, len(rows), MAX_FRAME_PLAYS):
+            chunk = rows[start:start + MAX_FRAME_PLAYS]
+            data = self._chunk_frames(log, chunk)
+
+            if self._offset + len(data) > self.segment_bytes:
+                self._rotate()
+                data = self._chunk_frames(log, chunk)
+                if self._offset + len(data) > self.segment_bytes:
+                    raise ValueError("lote de reproduções maior que o tamanho do segmento")
+
+            self._file.seek(self._offset)
+            self._file.write(data)
+            self._offset += len(data)
+
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
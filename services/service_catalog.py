@@ -1,14 +1,41 @@
 import json
+import os
+import threading
 import time
 import pika
 import requests
-from messaging import build_connection, configure_channel_for_consume, declare_queue
+from logs import get_logger
+from messaging import build_connection, configure_channel_for_consume, declare_queue, call_queue, PRIORITY_CLASSES
+from metrics import MetricsRegistry, bounded_label
+from registry import Heartbeat
+from tracing import from_properties, headers_for, stamp
+from services.cache import TTLCache, TokenBucket
 
 QUEUE_NAME = "service.catalog"
-BASE_URL = "https://musicbrainz.org/ws/2"
+ACTIONS = ["search", "list_by_artist", "get_details", "metrics"]
+BASE_URL = os.getenv("MUSICBRAINZ_URL", "https://musicbrainz.org/ws/2")
 HEADERS = {
     "User-Agent": "MusicMQ/1.0 ( educational_project )"
 }
+CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "10000"))
+CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "3600"))
+NEGATIVE_CACHE_TTL = float(os.getenv("CATALOG_NEGATIVE_CACHE_TTL", "300"))
+UPSTREAM_RATE = float(os.getenv("CATALOG_UPSTREAM_RATE", "1"))
+UPSTREAM_BURST = float(os.getenv("CATALOG_UPSTREAM_BURST", "5"))
+WARM_ENABLED = os.getenv("CATALOG_WARM", "1") == "1"
+WARM_TOP_N = int(os.getenv("CATALOG_WARM_TOP_N", "100"))
+WARM_INTERVAL = float(os.getenv("CATALOG_WARM_INTERVAL", "60"))
+WARM_REFRESH_AHEAD = float(os.getenv("CATALOG_WARM_REFRESH_AHEAD", "600"))
+WARM_RESERVE = float(os.getenv("CATALOG_WARM_RESERVE", "2"))
+WARM_SOURCE_QUEUE = os.getenv("CATALOG_WARM_SOURCE_QUEUE", "service.users")
+
+LOG = get_logger("catalog")
+REQUEST_LOG = get_logger("catalog.request")
+METRICS = MetricsRegistry("catalog")
+DETAILS_CACHE = TTLCache(CACHE_SIZE, CACHE_TTL)
+MISSING_DETAILS = TTLCache(CACHE_SIZE, NEGATIVE_CACHE_TTL)
+UPSTREAM = TokenBucket(UPSTREAM_RATE, UPSTREAM_BURST)
+METRICS.add_collector(lambda registry: registry.set_gauge("details_cache_entries", len(DETAILS_CACHE)))
 
 def _format_track(track):
     duration_ms = track.get("length")
@@ -50,11 +77,13 @@ def search_music(query, limit=10):
             "fmt": "json",
             "limit": limit
         }
+        UPSTREAM.take()
         response = requests.get(f"{BASE_URL}/recording", params=params, headers=HEADERS)
         data = response.json()
         recordings = data.get("recordings", [])
         return [_format_track(t) for t in recordings]
     except Exception:
+        LOG.warning("Falha ao consultar o MusicBrainz", exc_info=True)
         return []
 
 def list_by_artist(artist):
@@ -65,33 +94,121 @@ def list_by_artist(artist):
             "fmt": "json",
             "limit": 10
         }
+        UPSTREAM.take()
         response = requests.get(f"{BASE_URL}/recording", params=params, headers=HEADERS)
         data = response.json()
         recordings = data.get("recordings", [])
         return [_format_track(t) for t in recordings]
     except Exception:
+        LOG.warning("Falha ao consultar o MusicBrainz", exc_info=True)
         return []
 
-def get_music_details(music_id):
+class UpstreamUnavailable(Exception):
+    pass
+
+# 404 e 400 (id mal formado) significam "não existe" e vão para o cache negativo; qualquer outra
+# resposta ou falha de rede sobe como UpstreamUnavailable e não é guardada, para não esconder a
+# música por minutos.
+def _fetch_music_details(music_id):
+    params = {
+        "inc": "artist-credits+releases+genres",
+        "fmt": "json"
+    }
     try:
-        params = {
-            "inc": "artist-credits+releases+genres",
-            "fmt": "json"
-        }
         response = requests.get(f"{BASE_URL}/recording/{music_id}", params=params, headers=HEADERS)
-        if response.status_code == 200:
-            data = response.json()
-            return _format_track(data)
+    except Exception as e:
+        raise UpstreamUnavailable(f"Falha ao consultar o MusicBrainz: {e}") from e
+    if response.status_code in (400, 404):
         return None
-    except Exception:
+    if response.status_code != 200:
+        raise UpstreamUnavailable(f"MusicBrainz respondeu {response.status_code}")
+    return _format_track(response.json())
+
+def _store_details(music_id, details):
+    if details is None:
+        MISSING_DETAILS.put(music_id, True)
+    else:
+        DETAILS_CACHE.put(music_id, details)
+
+def get_music_details(music_id):
+    details = DETAILS_CACHE.get(music_id)
+    if details is not None:
+        METRICS.inc("details_cache_total", result="hit")
+        return details
+    if MISSING_DETAILS.get(music_id):
+        METRICS.inc("details_cache_total", result="negative_hit")
         return None
+    
+    METRICS.inc("details_cache_total", result="miss")
+    UPSTREAM.take()
+    try:
+        details = _fetch_music_details(music_id)
+    except UpstreamUnavailable:
+        METRICS.inc("upstream_errors_total")
+        raise
+    _store_details(music_id, details)
+    return details
+
+def hot_tracks():
+    requests_by_key = {
+        "global_most_played": {"action": "global_most_played", "params": {"limit": WARM_TOP_N}},
+        "trending": {"action": "trending", "params": {"window": "hour", "limit": WARM_TOP_N}},
+    }
+    music_ids = {}
+    for key, payload in requests_by_key.items():
+        try:
+            response = call_queue(WARM_SOURCE_QUEUE, payload, timeout=10, priority=PRIORITY_CLASSES["bulk"])
+        except TimeoutError:
+            LOG.warning("Serviço de usuários não respondeu '%s' para o aquecimento do cache", key)
+            continue
+        for item in response.get(key, []):
+            music_ids.setdefault(item["music_id"], None)
+    return list(music_ids)
+
+def warm_cache(music_ids, deadline):
+    warmed = 0
+    for music_id in music_ids:
+        if DETAILS_CACHE.expires_in(music_id) > WARM_REFRESH_AHEAD or MISSING_DETAILS.get(music_id):
+            continue
+        while not UPSTREAM.try_take(WARM_RESERVE):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return warmed
+            time.sleep(min(UPSTREAM.wait_time(WARM_RESERVE), remaining))
+        try:
+            _store_details(music_id, _fetch_music_details(music_id))
+        except UpstreamUnavailable:
+            METRICS.inc("upstream_errors_total")
+            LOG.warning("Aquecimento interrompido: MusicBrainz indisponível", exc_info=True)
+            return warmed
+        warmed += 1
+    return warmed
+
+def run_warmer():
+    while True:
+        deadline = time.monotonic() + WARM_INTERVAL
+        try:
+            warmed = warm_cache(hot_tracks(), deadline)
+            METRICS.inc("details_warmed_total", warmed)
+            LOG.debug("Cache aquecido com %d músicas", warmed)
+        except Exception:
+            LOG.exception("Falha no aquecimento do cache")
+        time.sleep(max(deadline - time.monotonic(), 0))
 
 def handle_request(ch, method, props, body):
+    started = time.perf_counter()
+    trace = None
+    action = None
+    
     try:
+        trace = from_properties(props)
+        stamp(trace, "catalog.recv")
         payload = json.loads(body.decode())
         action = payload.get("action")
         params = payload.get("params", {})
         
+        REQUEST_LOG.debug("Processando ação '%s'", action, extra={"params": params})
+        
         response = {}
         
         if action == "search":
@@ -107,25 +224,44 @@ def handle_request(ch, method, props, body):
             
         elif action == "get_details":
             music_id = params.get("music_id")
-            result = get_music_details(music_id)
-            if result:
-                response = {"music": result}
+            if not isinstance(music_id, str) or not music_id:
+                response = {"error": "music_id é obrigatório"}
             else:
-                response = {"error": "Música não encontrada"}
+                try:
+                    result = get_music_details(music_id)
+                    if result:
+                        response = {"music": result}
+                    else:
+                        response = {"error": "Música não encontrada"}
+                except UpstreamUnavailable as e:
+                    LOG.warning("Detalhes de '%s' indisponíveis: %s", music_id, e)
+                    response = {"error": "Catálogo indisponível no momento, tente novamente"}
+            
+        elif action == "metrics":
+            if params.get("format") == "prometheus":
+                response = {"metrics": METRICS.to_prometheus()}
+            else:
+                response = {"metrics": METRICS.snapshot()}
             
         else:
             response = {"error": f"Ação '{action}' não reconhecida"}
         
     except Exception as e:
+        LOG.exception("Falha ao processar ação '%s'", action)
         response = {"error": str(e)}
     
+    stamp(trace, "catalog.reply")
     ch.basic_publish(
         exchange="",
         routing_key=props.reply_to,
-        properties=pika.BasicProperties(correlation_id=props.correlation_id),
+        properties=pika.BasicProperties(correlation_id=props.correlation_id, headers=headers_for(trace)),
         body=json.dumps(response),
     )
     ch.basic_ack(delivery_tag=method.delivery_tag)
+    action_label = bounded_label(action, ACTIONS)
+    METRICS.observe("request_latency_ms", (time.perf_counter() - started) * 1000, action=action_label)
+    if "error" in response:
+        METRICS.inc("errors_total", action=action_label)
 
 def main():
     conn = build_connection()
@@ -133,14 +269,20 @@ def main():
     declare_queue(ch, QUEUE_NAME)
     
     ch.basic_consume(queue=QUEUE_NAME, on_message_callback=handle_request)
+    heartbeat = Heartbeat("catalog", QUEUE_NAME, ACTIONS)
+    heartbeat.start()
+    
+    if WARM_ENABLED:
+        threading.Thread(target=run_warmer, daemon=True).start()
     
-    print(f"[service_catalog] Aguardando requisições na fila '{QUEUE_NAME}'")
+    LOG.info("Aguardando requisições na fila '%s'", QUEUE_NAME)
     
     try:
         ch.start_consuming()
     except KeyboardInterrupt:
         pass
     finally:
+        heartbeat.stop()
         conn.close()
 
 if __name__ == "__main__":
@@ -1,46 +1,166 @@
 import json
+import os
 import time
+import uuid
 import pika
-from common.rpc_utils import build_connection
+from logs import get_logger
+from messaging import build_connection, configure_channel_for_consume, declare_queue, SIMULATED_LATENCY_SCALE
+from metrics import MetricsRegistry, bounded_label
+from registry import Heartbeat
+from tracing import from_properties, headers_for, stamp
+from services.numeric_stats import Accumulator, DEFAULT_BINS, DEFAULT_PERCENTILES, decode_values, describe, group_stats, mean
 
 QUEUE_NAME = "service.media"
+ACTIONS = [
+    "mean", "describe", "group_stats", "session_open", "session_append", "session_stats", "session_close",
+    "metrics"
+]
+SESSION_TTL = float(os.getenv("MEDIA_SESSION_TTL", "300"))
+SESSION_MAX_VALUES = int(os.getenv("MEDIA_SESSION_MAX_VALUES", "10000000"))
+MAX_SESSIONS = int(os.getenv("MEDIA_MAX_SESSIONS", "64"))
+MAX_BUFFERED_VALUES = int(os.getenv("MEDIA_MAX_BUFFERED_VALUES", "20000000"))
+
+SESSIONS = {}
+LOG = get_logger("media")
+REQUEST_LOG = get_logger("media.request")
+METRICS = MetricsRegistry("media")
+METRICS.add_collector(lambda registry: registry.set_gauge("sessions", len(SESSIONS)))
+METRICS.add_collector(lambda registry: registry.set_gauge("buffered_values", buffered_values()))
+
+
+def _describe_options(params: dict) -> dict:
+    value_range = params.get("range")
+    return {
+        "percentiles": params.get("percentiles", DEFAULT_PERCENTILES),
+        "bins": params.get("bins", DEFAULT_BINS),
+        "value_range": tuple(value_range) if value_range else None,
+    }
+
+
+def expire_sessions():
+    now = time.monotonic()
+    for session_id in [s for s, (_, touched) in SESSIONS.items() if now - touched > SESSION_TTL]:
+        del SESSIONS[session_id]
+        LOG.info("Sessão '%s' expirada", session_id)
+
+
+def buffered_values() -> int:
+    return sum(accumulator.count for accumulator, _ in SESSIONS.values())
+
+
+def open_session() -> str:
+    if len(SESSIONS) >= MAX_SESSIONS:
+        raise ValueError(f"limite de {MAX_SESSIONS} sessões abertas atingido; "
+                         "feche uma sessão ou aguarde a expiração")
+    session_id = f"ms_{uuid.uuid4().hex[:8]}"
+    SESSIONS[session_id] = (Accumulator(SESSION_MAX_VALUES), time.monotonic())
+    return session_id
+
+
+def get_session(session_id: str):
+    entry = SESSIONS.get(session_id)
+    if entry is None:
+        return None
+    SESSIONS[session_id] = (entry[0], time.monotonic())
+    return entry[0]
+
 
 def handle_request(ch, method, props, body):
+    started = time.perf_counter()
+    trace = None
+    action = None
+
     try:
+        trace = from_properties(props)
+        stamp(trace, "media.recv")
         payload = json.loads(body.decode())
+        action = payload.get("action")
         params = payload.get("params", {})
-        numbers = params.get("numbers", [])
-        print(f"[service_media] calculando média de {numbers} (corr_id={props.correlation_id})")
-        time.sleep(1.5)
-        if not numbers:
-            raise ValueError("lista vazia")
-        result = sum(numbers) / len(numbers)
-        response = json.dumps({"result": result})
+
+        REQUEST_LOG.debug("Processando ação '%s'", action, extra={"params": params})
+
+        time.sleep(0.05 * SIMULATED_LATENCY_SCALE)
+        expire_sessions()
+
+        if action == "mean":
+            response = {"result": mean(decode_values(params))}
+
+        elif action == "describe":
+            response = {"stats": describe(decode_values(params), **_describe_options(params))}
+
+        elif action == "group_stats":
+            keys = params.get("keys", [])
+            groups = group_stats(keys, decode_values(params))
+            response = {"groups": groups, "count": len(groups)}
+
+        elif action == "session_open":
+            response = {"session_id": open_session(), "ttl": SESSION_TTL}
+
+        elif action in ("session_append", "session_stats", "session_close"):
+            session_id = params.get("session_id")
+            session = get_session(session_id)
+
+            if session is None:
+                response = {"error": f"Sessão '{session_id}' não encontrada ou expirada"}
+            elif action == "session_append":
+                values = decode_values(params)
+                if buffered_values() + values.size > MAX_BUFFERED_VALUES:
+                    raise ValueError(f"sessões já acumulam o limite de {MAX_BUFFERED_VALUES} valores no serviço")
+                session.append(values)
+                response = {"session_id": session_id, "count": session.count}
+            else:
+                response = {"session_id": session_id, "stats": describe(session.values(), **_describe_options(params))}
+                if action == "session_close":
+                    del SESSIONS[session_id]
+
+        elif action == "metrics":
+            if params.get("format") == "prometheus":
+                response = {"metrics": METRICS.to_prometheus()}
+            else:
+                response = {"metrics": METRICS.snapshot()}
+
+        else:
+            response = {"error": f"Ação '{action}' não reconhecida"}
+
+    except ValueError as e:
+        response = {"error": str(e)}
     except Exception as e:
-        response = json.dumps({"error": str(e)})
+        LOG.exception("Falha ao processar ação '%s'", action)
+        response = {"error": str(e)}
 
+    stamp(trace, "media.reply")
     ch.basic_publish(
         exchange="",
         routing_key=props.reply_to,
-        properties=pika.BasicProperties(correlation_id=props.correlation_id),
-        body=response,
+        properties=pika.BasicProperties(correlation_id=props.correlation_id, headers=headers_for(trace)),
+        body=json.dumps(response),
     )
     ch.basic_ack(delivery_tag=method.delivery_tag)
+    action_label = bounded_label(action, ACTIONS)
+    METRICS.observe("request_latency_ms", (time.perf_counter() - started) * 1000, action=action_label)
+    if "error" in response:
+        METRICS.inc("errors_total", action=action_label)
 
 
 def main():
     conn = build_connection()
-    ch = conn.channel()
-    ch.queue_declare(queue=QUEUE_NAME)
-    ch.basic_qos(prefetch_count=1)
+    ch = configure_channel_for_consume(conn)
+    declare_queue(ch, QUEUE_NAME)
+
     ch.basic_consume(queue=QUEUE_NAME, on_message_callback=handle_request)
-    print(f"[service_media] aguardando requisições na fila '{QUEUE_NAME}'")
+    heartbeat = Heartbeat("media", QUEUE_NAME, ACTIONS)
+    heartbeat.start()
+
+    LOG.info("Aguardando requisições na fila '%s'", QUEUE_NAME)
+
     try:
         ch.start_consuming()
     except KeyboardInterrupt:
-        print("Encerrando service_media...")
+        LOG.info("Encerrando...")
     finally:
+        heartbeat.stop()
         conn.close()
 
+
 if __name__ == "__main__":
     main()
@@ -1,13 +1,35 @@
+import argparse
+import bisect
 import json
+import os
 import time
 import uuid
 from datetime import datetime
 import pika
-from messaging import build_connection, configure_channel_for_consume, declare_queue
+from logs import get_logger
+from messaging import build_connection, configure_channel_for_consume, declare_queue, SIMULATED_LATENCY_SCALE
+from registry import Heartbeat
+from replication import ChangePublisher, ReplicaState, subscribe_changes, wait_for_snapshot, READ_QUEUE_SUFFIX
+from metrics import MetricsRegistry, bounded_label
+from tracing import from_properties, headers_for, stamp
 
 QUEUE_NAME = "service.playlist"
+READ_QUEUE_NAME = QUEUE_NAME + READ_QUEUE_SUFFIX
+WRITE_ACTIONS = {"create", "add_music", "remove_music", "delete", "update", "replication_snapshot"}
+ACTIONS = [
+    "create", "get", "list_user_playlists", "add_music", "remove_music", "delete", "update",
+    "replication_snapshot", "metrics"
+]
+SNAPSHOT_PAGE_SIZE = int(os.getenv("PLAYLIST_SNAPSHOT_PAGE_SIZE", "5000"))
 
 PLAYLISTS_DATABASE = {}
+CHANGES = ChangePublisher("playlist")
+REPLICA = None
+SNAPSHOT_KEYS = []
+LOG = get_logger("playlist")
+REQUEST_LOG = get_logger("playlist.request")
+METRICS = MetricsRegistry("playlist")
+METRICS.add_collector(lambda registry: registry.set_gauge("playlists", len(PLAYLISTS_DATABASE)))
 
 
 def create_playlist(user_id: str, name: str, description: str = ""):
@@ -24,6 +46,7 @@ def create_playlist(user_id: str, name: str, description: str = ""):
     }
     
     PLAYLISTS_DATABASE[playlist_id] = playlist
+    CHANGES.publish("upsert", playlist=playlist)
     return playlist
 
 
@@ -47,6 +70,7 @@ def add_music_to_playlist(playlist_id: str, music_ids: list):
             playlist["music_ids"].append(music_id)
     
     playlist["updated_at"] = datetime.now().isoformat()
+    CHANGES.publish("upsert", playlist=playlist)
     return playlist
 
 
@@ -59,6 +83,7 @@ def remove_music_from_playlist(playlist_id: str, music_id: str):
     if music_id in playlist["music_ids"]:
         playlist["music_ids"].remove(music_id)
         playlist["updated_at"] = datetime.now().isoformat()
+        CHANGES.publish("upsert", playlist=playlist)
     
     return playlist
 
@@ -66,6 +91,7 @@ def remove_music_from_playlist(playlist_id: str, music_id: str):
 def delete_playlist(playlist_id: str):
     if playlist_id in PLAYLISTS_DATABASE:
         del PLAYLISTS_DATABASE[playlist_id]
+        CHANGES.publish("delete", playlist_id=playlist_id)
         return {"success": True, "message": "Playlist deletada"}
     return {"error": "Playlist não encontrada"}
 
@@ -82,20 +108,70 @@ def update_playlist(playlist_id: str, name: str = None, description: str = None)
         playlist["description"] = description
     
     playlist["updated_at"] = datetime.now().isoformat()
+    CHANGES.publish("upsert", playlist=playlist)
     return playlist
 
 
+# Páginas por cursor sobre os ids ordenados na primeira página. Playlists criadas, alteradas ou
+# removidas depois dela chegam de novo pelo stream de mudanças, então o cursor pode pular ou
+# repetir versões sem deixar a réplica inconsistente.
+def export_snapshot(params: dict):
+    global SNAPSHOT_KEYS
+    
+    after = params.get("after")
+    if after is None:
+        SNAPSHOT_KEYS = sorted(PLAYLISTS_DATABASE)
+        start = 0
+    else:
+        start = bisect.bisect_right(SNAPSHOT_KEYS, after)
+    keys = SNAPSHOT_KEYS[start:start + SNAPSHOT_PAGE_SIZE]
+    
+    return {
+        "position": CHANGES.position(),
+        "playlists": {key: PLAYLISTS_DATABASE[key] for key in keys if key in PLAYLISTS_DATABASE},
+        "next": {"after": keys[-1]} if start + len(keys) < len(SNAPSHOT_KEYS) else None
+    }
+
+
+def load_snapshot(pages: list):
+    for page in pages:
+        PLAYLISTS_DATABASE.update(page["playlists"])
+    position = pages[0]["position"]
+    REPLICA.start_from(position["epoch"], position["seq"])
+
+
+def handle_change_event(ch, method, props, body):
+    event = json.loads(body.decode())
+    if not REPLICA.accept(event):
+        return
+    
+    if event.get("op") == "upsert":
+        playlist = event["playlist"]
+        PLAYLISTS_DATABASE[playlist["id"]] = playlist
+    elif event.get("op") == "delete":
+        PLAYLISTS_DATABASE.pop(event["playlist_id"], None)
+
+
 def handle_request(ch, method, props, body):
+    started = time.perf_counter()
+    trace = None
+    action = None
+    
     try:
+        trace = from_properties(props)
+        stamp(trace, "playlist.recv")
         payload = json.loads(body.decode())
         action = payload.get("action")
         params = payload.get("params", {})
         
-        print(f"[service_playlist] Processando ação '{action}' com params={params}")
+        REQUEST_LOG.debug("Processando ação '%s'", action, extra={"params": params})
         
-        time.sleep(0.2)
+        time.sleep(0.2 * SIMULATED_LATENCY_SCALE)
         
-        if action == "create":
+        if REPLICA is not None and action in WRITE_ACTIONS:
+            response = {"error": f"Ação '{action}' não é atendida por réplicas de leitura"}
+            
+        elif action == "create":
             user_id = params.get("user_id")
             name = params.get("name")
             description = params.get("description", "")
@@ -148,40 +224,115 @@ def handle_request(ch, method, props, body):
             result = update_playlist(playlist_id, name, description)
             response = {"playlist": result}
             
+        elif action == "replication_snapshot":
+            response = export_snapshot(params)
+            
+        elif action == "metrics":
+            if params.get("format") == "prometheus":
+                response = {"metrics": METRICS.to_prometheus()}
+            else:
+                response = {"metrics": METRICS.snapshot()}
+            
         else:
             response = {"error": f"Ação '{action}' não reconhecida"}
         
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        LOG.exception("Falha ao processar ação '%s'", action)
         response = {"error": str(e)}
     
+    if REPLICA is not None:
+        response["replication"] = REPLICA.status()
+    
+    stamp(trace, "playlist.reply")
     ch.basic_publish(
         exchange="",
         routing_key=props.reply_to,
-        properties=pika.BasicProperties(correlation_id=props.correlation_id),
+        properties=pika.BasicProperties(correlation_id=props.correlation_id, headers=headers_for(trace)),
         body=json.dumps(response),
     )
     ch.basic_ack(delivery_tag=method.delivery_tag)
-    print(f"[service_playlist] Resposta enviada para '{action}'")
+    action_label = bounded_label(action, ACTIONS)
+    METRICS.observe("request_latency_ms", (time.perf_counter() - started) * 1000, action=action_label)
+    if "error" in response:
+        METRICS.inc("errors_total", action=action_label)
+    REQUEST_LOG.debug("Resposta enviada para '%s'", action)
 
 
-def main():
+def run_replica():
+    global REPLICA
+    REPLICA = ReplicaState()
+    
+    conn = build_connection()
+    changes_ch = conn.channel()
+    changes_queue = subscribe_changes(changes_ch, "playlist")
+    
+    wait_for_snapshot(conn, QUEUE_NAME, load_snapshot)
+    LOG.info("Réplica iniciada com %d playlists do primário", len(PLAYLISTS_DATABASE))
+    
+    changes_ch.basic_consume(queue=changes_queue, on_message_callback=handle_change_event, auto_ack=True)
+    
+    ch = configure_channel_for_consume(conn)
+    declare_queue(ch, READ_QUEUE_NAME)
+    heartbeat = None
+    
+    # Fora de sincronia a réplica sai do ar (heartbeat "down" e sem consumir leituras), descarta o
+    # estado e recarrega o snapshot antes de voltar a atender.
+    try:
+        while True:
+            read_tag = ch.basic_consume(queue=READ_QUEUE_NAME, on_message_callback=handle_request)
+            heartbeat = Heartbeat("playlist", READ_QUEUE_NAME, [a for a in ACTIONS if a not in WRITE_ACTIONS])
+            heartbeat.start()
+            LOG.info("Réplica de leitura aguardando requisições na fila '%s'", READ_QUEUE_NAME)
+            
+            while REPLICA.in_sync:
+                conn.process_data_events(time_limit=1)
+            
+            LOG.warning("Réplica fora de sincronia com o primário; recarregando snapshot")
+            heartbeat.stop()
+            ch.basic_cancel(read_tag)
+            PLAYLISTS_DATABASE.clear()
+            wait_for_snapshot(conn, QUEUE_NAME, load_snapshot)
+            LOG.info("Réplica ressincronizada com %d playlists", len(PLAYLISTS_DATABASE))
+    except KeyboardInterrupt:
+        LOG.info("Encerrando...")
+    finally:
+        if heartbeat is not None:
+            heartbeat.stop()
+        conn.close()
+
+
+def run_primary():
     conn = build_connection()
     ch = configure_channel_for_consume(conn)
     declare_queue(ch, QUEUE_NAME)
+    CHANGES.attach(conn.channel())
     
     ch.basic_consume(queue=QUEUE_NAME, on_message_callback=handle_request)
+    heartbeat = Heartbeat("playlist", QUEUE_NAME, ACTIONS)
+    heartbeat.start()
     
-    print(f"[service_playlist] Aguardando requisições na fila '{QUEUE_NAME}'")
+    LOG.info("Aguardando requisições na fila '%s'", QUEUE_NAME)
     
     try:
         ch.start_consuming()
     except KeyboardInterrupt:
-        print("\n[service_playlist] Encerrando...")
+        LOG.info("Encerrando...")
     finally:
+        heartbeat.stop()
         conn.close()
 
 
+def main():
+    parser = argparse.ArgumentParser(description="Serviço de playlists")
+    parser.add_argument("--replica", action="store_true",
+                       help="Executar como réplica de leitura alimentada pelo primário")
+    args = parser.parse_args()
+    
+    if args.replica:
+        run_replica()
+    else:
+        run_primary()
+
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
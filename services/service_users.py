@@ -1,60 +1,530 @@
+import argparse
+import base64
+import bisect
 import json
+import math
+import os
 import time
-from datetime import datetime
+from array import array
+from datetime import datetime, timezone
 from collections import Counter
+import numpy as np
 import pika
-from messaging import build_connection, configure_channel_for_consume, declare_queue
+from logs import get_logger
+from messaging import build_connection, configure_channel_for_consume, declare_queue, SIMULATED_LATENCY_SCALE
+from registry import Heartbeat
+from replication import ChangePublisher, ReplicaState, subscribe_changes, wait_for_snapshot, READ_QUEUE_SUFFIX
+from metrics import MetricsRegistry, bounded_label
+from tracing import from_properties, headers_for, stamp
+from services.recommendations import CoOccurrenceIndex
+from services.play_log import PlayLog, RecentPlaysRing, now_ms, ms_to_iso
+from services.segment_store import SegmentStore
+from services.sketches import HyperLogLog, StreamSummary, hash64
+from services.trending import BucketedCounter, WINDOWS, DAY_MS, window_start
 
 QUEUE_NAME = "service.users"
+EVENTS_QUEUE_NAME = QUEUE_NAME + ".events"
+READ_QUEUE_NAME = QUEUE_NAME + READ_QUEUE_SUFFIX
+WRITE_ACTIONS = {"play", "play_batch", "ingest_stats", "replication_snapshot"}
+ACTIONS = [
+    "play", "play_batch", "ingest_stats", "replication_snapshot", "get_history", "most_played", "get_stats",
+    "recent_plays_all", "global_most_played", "trending", "similar_tracks", "recommend_for_user",
+    "unique_listeners", "daily_uniques", "export_sketch", "merge_sketches", "metrics"
+]
+PLAY_BATCH_SIZE = int(os.getenv("USERS_PLAY_BATCH_SIZE", "500"))
+PLAY_BATCH_INTERVAL = float(os.getenv("USERS_PLAY_BATCH_INTERVAL", "0.2"))
+PLAY_MAX_AGE_MS = int(float(os.getenv("USERS_PLAY_MAX_AGE_DAYS", "30")) * DAY_MS)
+PLAY_MAX_FUTURE_MS = 60_000
+GLOBAL_TOP_CAPACITY = int(os.getenv("USERS_GLOBAL_TOP_CAPACITY", "0")) or None
+HLL_PRECISION = int(os.getenv("USERS_HLL_PRECISION", "10"))
+DAILY_HLL_PRECISION = int(os.getenv("USERS_DAILY_HLL_PRECISION", "14"))
+SKETCH_RETENTION_DAYS = int(os.getenv("USERS_SKETCH_RETENTION_DAYS", "90"))
+RECOMMENDATION_SEEDS = int(os.getenv("USERS_RECOMMENDATION_SEEDS", "20"))
+RECENT_PLAYS_CAPACITY = int(os.getenv("USERS_RECENT_PLAYS_CAPACITY", "1000"))
+PLAY_LOG_DIR = os.getenv("USERS_PLAY_LOG_DIR", os.path.join("data", "plays"))
+PLAY_LOG_SEGMENT_MB = int(os.getenv("USERS_PLAY_LOG_SEGMENT_MB", "64"))
+PLAY_LOG_MAX_SEGMENTS = int(os.getenv("USERS_PLAY_LOG_MAX_SEGMENTS", "32"))
+PLAY_LOG_FSYNC = os.getenv("USERS_PLAY_LOG_FSYNC", "0") == "1"
+REPLAY_BLOCK = 1 << 20
+SNAPSHOT_PAGE_ROWS = int(os.getenv("USERS_SNAPSHOT_PAGE_ROWS", "262144"))
 
 USERS_DATABASE = {}
-PLAY_HISTORY = []
+PLAY_LOG = PlayLog()
+PLAY_STORE = None
+CHANGES = ChangePublisher("users")
+REPLICA = None
+LOG = get_logger("users")
+REQUEST_LOG = get_logger("users.request")
+METRICS = MetricsRegistry("users")
+RECENT_PLAYS = RecentPlaysRing(RECENT_PLAYS_CAPACITY)
+CO_OCCURRENCE = CoOccurrenceIndex()
+USER_HISTORY = {}
+USER_PLAY_COUNTS = {}
+GLOBAL_TOP = StreamSummary(capacity=GLOBAL_TOP_CAPACITY)
+GLOBAL_TRENDING = BucketedCounter()
+
+USER_HASHES = []
+TRACK_HASHES = []
+TRACK_LISTENER_SKETCHES = {}
+DAILY_TRACK_SKETCHES = {}
+DAILY_LISTENER_SKETCHES = {}
+
+PENDING_PLAYS = []
+PENDING_DELIVERY = {"tag": None}
+INGEST_STATS = {
+    "events": 0,
+    "rejected": 0,
+    "batches": 0,
+    "apply_seconds": 0.0,
+    "first_event_at": None,
+    "last_event_at": None
+}
+
+
+def _valid_id(value) -> bool:
+    return isinstance(value, str) and bool(value)
+
+
+# Valida antes de internar: um id inválido não pode deixar a reprodução aplicada pela metade
+# (índices atualizados, mas sem persistência nem publicação para as réplicas).
+def _apply_play(user_id: str, music_id: str, played_at_ms: int):
+    if not _valid_id(user_id) or not _valid_id(music_id):
+        raise ValueError("user_id e music_id devem ser textos não vazios")
+    if not isinstance(played_at_ms, int) or isinstance(played_at_ms, bool):
+        raise ValueError("played_at_ms deve ser um inteiro")
+    uid = PLAY_LOG.users.intern(user_id)
+    tid = PLAY_LOG.tracks.intern(music_id)
+    row = PLAY_LOG.append_ids(uid, tid, played_at_ms)
+    _index_play(uid, tid, row, played_at_ms)
+    return uid, tid, played_at_ms
+
+
+def _index_play(uid: int, tid: int, row: int, played_at_ms: int):
+    RECENT_PLAYS.push(uid, tid, played_at_ms)
+    CO_OCCURRENCE.add(uid, tid, played_at_ms)
+    
+    user_rows = USER_HISTORY.get(uid)
+    if user_rows is None:
+        user_rows = USER_HISTORY[uid] = array("I")
+    if user_rows and played_at_ms < PLAY_LOG.row(user_rows[-1])[2]:
+        user_rows.insert(bisect.bisect_right(user_rows, played_at_ms, key=_row_timestamp), row)
+    else:
+        user_rows.append(row)
+    
+    play_counts = USER_PLAY_COUNTS.get(uid)
+    if play_counts is None:
+        play_counts = USER_PLAY_COUNTS[uid] = Counter()
+    play_counts[tid] += 1
+    GLOBAL_TOP.increment(tid)
+    
+    GLOBAL_TRENDING.add(tid, played_at_ms)
+    
+    _update_sketches(uid, tid, played_at_ms)
+    
+    user_id = PLAY_LOG.users.name(uid)
+    user = USERS_DATABASE.get(user_id)
+    if user is None:
+        user = USERS_DATABASE[user_id] = {
+            "user_id": user_id,
+            "total_plays": 0,
+            "unique_songs": 0,
+            "created_at": ms_to_iso(played_at_ms)
+        }
+    
+    user["total_plays"] += 1
+    user["unique_songs"] = len(play_counts)
+
+
+def _row_timestamp(row: int) -> int:
+    return PLAY_LOG.row(row)[2]
+
+
+def _sketch_for(sketches: dict, key, precision: int) -> HyperLogLog:
+    sketch = sketches.get(key)
+    if sketch is None:
+        sketch = sketches[key] = HyperLogLog(precision)
+    return sketch
+
+
+def _cached_hash(hashes: list, idx: int, interner) -> int:
+    if idx >= len(hashes):
+        hashes.extend([None] * (idx + 1 - len(hashes)))
+    h = hashes[idx]
+    if h is None:
+        h = hashes[idx] = hash64(interner.name(idx))
+    return h
+
+
+def _daily_sketches(day: int):
+    if day not in DAILY_TRACK_SKETCHES:
+        for old_day in [d for d in DAILY_TRACK_SKETCHES if d <= day - SKETCH_RETENTION_DAYS]:
+            DAILY_TRACK_SKETCHES.pop(old_day, None)
+            DAILY_LISTENER_SKETCHES.pop(old_day, None)
+    return (_sketch_for(DAILY_TRACK_SKETCHES, day, DAILY_HLL_PRECISION),
+            _sketch_for(DAILY_LISTENER_SKETCHES, day, DAILY_HLL_PRECISION))
+
+
+def _update_sketches(uid: int, tid: int, played_at_ms: int):
+    user_hash = _cached_hash(USER_HASHES, uid, PLAY_LOG.users)
+    track_hash = _cached_hash(TRACK_HASHES, tid, PLAY_LOG.tracks)
+    
+    _sketch_for(TRACK_LISTENER_SKETCHES, tid, HLL_PRECISION).add_hash(user_hash)
+    
+    track_sketch, listener_sketch = _daily_sketches(played_at_ms // DAY_MS)
+    track_sketch.add_hash(track_hash)
+    listener_sketch.add_hash(user_hash)
+
+
+def _persist(rows: list):
+    if PLAY_STORE is not None and rows:
+        PLAY_STORE.append(PLAY_LOG, rows)
+
+
+def _pair_groups(major, minor):
+    keys, counts = np.unique(major.astype(np.int64) << 32 | minor, return_counts=True)
+    majors = keys >> 32
+    bounds = (np.flatnonzero(majors[1:] != majors[:-1]) + 1).tolist()
+    minors = (keys & 0xFFFFFFFF).tolist()
+    counts = counts.tolist()
+    for start, end in zip([0] + bounds, bounds + [len(minors)]):
+        yield int(majors[start]), minors[start:end], counts[start:end]
+
+
+def _hashes_for(hashes: list, ids, interner) -> list:
+    for idx in ids:
+        _cached_hash(hashes, idx, interner)
+    return hashes
+
+
+# Co-ocorrência, contagens (a ordem de inserção desempata most_common) e created_at seguem a ordem
+# de chegada, como no caminho ao vivo; o histórico segue a ordem de tempo (lexsort é estável, então
+# empates mantêm a ordem de chegada).
+def _index_user_block(uids, tids, played, first_row: int):
+    CO_OCCURRENCE.add_block(uids, tids, played)
+    
+    order = np.lexsort((played, uids))
+    sorted_uids = uids[order]
+    bounds = (np.flatnonzero(sorted_uids[1:] != sorted_uids[:-1]) + 1).tolist()
+    starts, ends = [0] + bounds, bounds + [len(order)]
+    rows = (order + first_row).tolist()
+    tid_list = tids[np.argsort(uids, kind="stable")].tolist()
+    ts_list = played[order].tolist()
+    first_played = played[np.unique(uids, return_index=True)[1]].tolist()
+    users = PLAY_LOG.users
+    
+    for uid, start, end, first_ms in zip(sorted_uids[starts].tolist(), starts, ends, first_played):
+        user_ts = ts_list[start:end]
+        user_rows = USER_HISTORY.get(uid)
+        if user_rows is None:
+            user_rows = USER_HISTORY[uid] = array("I")
+        if user_rows and user_ts[0] < PLAY_LOG.row(user_rows[-1])[2]:
+            for row, played_at_ms in zip(rows[start:end], user_ts):
+                user_rows.insert(bisect.bisect_right(user_rows, played_at_ms, key=_row_timestamp), row)
+        else:
+            user_rows.extend(rows[start:end])
+        
+        play_counts = USER_PLAY_COUNTS.get(uid)
+        if play_counts is None:
+            play_counts = USER_PLAY_COUNTS[uid] = Counter()
+        play_counts.update(tid_list[start:end])
+        
+        user_id = users.name(uid)
+        user = USERS_DATABASE.get(user_id)
+        if user is None:
+            user = USERS_DATABASE[user_id] = {
+                "user_id": user_id,
+                "total_plays": 0,
+                "unique_songs": 0,
+                "created_at": ms_to_iso(first_ms)
+            }
+        user["total_plays"] += end - start
+        user["unique_songs"] = len(play_counts)
+
+
+def _index_block(users, tracks, timestamps, first_row: int):
+    uids = np.frombuffer(users, dtype=np.uint32)
+    tids = np.frombuffer(tracks, dtype=np.uint32)
+    played = np.frombuffer(timestamps, dtype=np.int64)
+    
+    for offset in range(max(len(users) - RECENT_PLAYS.capacity, 0), len(users)):
+        RECENT_PLAYS.push(users[offset], tracks[offset], timestamps[offset])
+    
+    _index_user_block(uids, tids, played, first_row)
+    
+    distinct, counts = np.unique(tids, return_counts=True)
+    for tid, count in zip(distinct.tolist(), counts.tolist()):
+        GLOBAL_TOP.increment(tid, count)
+    
+    for tier_index, width in enumerate(GLOBAL_TRENDING.widths()):
+        for bucket, bucket_tids, bucket_counts in _pair_groups(played // width, tids):
+            GLOBAL_TRENDING.add_bucket(tier_index, bucket * width, dict(zip(bucket_tids, bucket_counts)))
+    
+    user_hashes = _hashes_for(USER_HASHES, np.unique(uids).tolist(), PLAY_LOG.users)
+    track_hashes = _hashes_for(TRACK_HASHES, distinct.tolist(), PLAY_LOG.tracks)
+    for tid, listeners, _ in _pair_groups(tids, uids):
+        _sketch_for(TRACK_LISTENER_SKETCHES, tid, HLL_PRECISION).add_hashes(map(user_hashes.__getitem__, listeners))
+    days = played // DAY_MS
+    for (day, day_tids, _), (_, day_uids, _) in zip(_pair_groups(days, tids), _pair_groups(days, uids)):
+        track_sketch, listener_sketch = _daily_sketches(day)
+        track_sketch.add_hashes(map(track_hashes.__getitem__, day_tids))
+        listener_sketch.add_hashes(map(user_hashes.__getitem__, day_uids))
+
+
+# Reconstrução em blocos: contagens, top global, trending, sketches e co-ocorrência são agregados
+# por bloco (np.unique sobre chaves combinadas) e aplicados uma vez por chave distinta, produzindo
+# o mesmo estado que _index_play aplicado linha a linha.
+def _replay_rows(users, tracks, timestamps):
+    for start in range(0, len(users), REPLAY_BLOCK):
+        end = start + REPLAY_BLOCK
+        block = users[start:end], tracks[start:end], timestamps[start:end]
+        _index_block(*block, PLAY_LOG.extend_ids(*block))
+
+
+def open_play_store():
+    global PLAY_STORE
+    
+    if not PLAY_LOG_DIR:
+        return None
+    
+    PLAY_STORE = SegmentStore(
+        PLAY_LOG_DIR,
+        segment_bytes=PLAY_LOG_SEGMENT_MB * 1024 * 1024,
+        max_segments=PLAY_LOG_MAX_SEGMENTS,
+        fsync=PLAY_LOG_FSYNC
+    )
+    
+    started = time.perf_counter()
+    PLAY_STORE.replay(PLAY_LOG, _replay_rows, batch_rows=REPLAY_BLOCK)
+    CO_OCCURRENCE.refresh()
+    elapsed = time.perf_counter() - started
+    LOG.info("%d reproduções recuperadas de '%s' em %.2fs", len(PLAY_LOG), PLAY_LOG_DIR, elapsed)
+    
+    return PLAY_STORE
 
 
 def register_play(user_id: str, music_id: str):
-    play_record = {
+    played_at_ms = now_ms()
+    _persist([_apply_play(user_id, music_id, played_at_ms)])
+    CHANGES.publish("plays", plays=[[user_id, music_id, played_at_ms]])
+    
+    return {
         "user_id": user_id,
         "music_id": music_id,
-        "played_at": datetime.now().isoformat()
+        "played_at": ms_to_iso(played_at_ms)
     }
+
+
+def _played_at(play: dict, received_at_ms: int):
+    played_at_ms = play.get("played_at_ms")
+    if played_at_ms is None:
+        return received_at_ms
+    if not isinstance(played_at_ms, int) or isinstance(played_at_ms, bool):
+        return None
+    if not received_at_ms - PLAY_MAX_AGE_MS <= played_at_ms <= received_at_ms + PLAY_MAX_FUTURE_MS:
+        return None
+    return played_at_ms
+
+
+def register_plays(plays: list):
+    received_at_ms = now_ms()
+    rows = []
     
-    PLAY_HISTORY.append(play_record)
+    try:
+        for play in plays:
+            if not isinstance(play, dict):
+                continue
+            user_id = play.get("user_id")
+            music_id = play.get("music_id")
+            if not _valid_id(user_id) or not _valid_id(music_id):
+                continue
+            played_at_ms = _played_at(play, received_at_ms)
+            if played_at_ms is None:
+                continue
+            rows.append(_apply_play(user_id, music_id, played_at_ms))
+    finally:
+        _persist(rows)
+        if rows:
+            CHANGES.publish("plays", plays=[
+                [PLAY_LOG.users.name(uid), PLAY_LOG.tracks.name(tid), played_at_ms]
+                for uid, tid, played_at_ms in rows
+            ])
+    return len(rows), len(plays) - len(rows)
+
+
+def _names_upto(column: bytes, known: int) -> int:
+    if not column:
+        return known
+    return max(known, int(np.frombuffer(column, dtype=np.uint32).max()) + 1)
+
+
+# Cada página leva as linhas [offset, offset + SNAPSHOT_PAGE_ROWS) do log até o "end" fixado na
+# primeira página, mais os nomes dos ids que ela referencia e que a réplica ainda não recebeu.
+def export_snapshot(params: dict):
+    offset = int(params.get("offset", 0))
+    end = min(int(params.get("end", len(PLAY_LOG))), len(PLAY_LOG))
+    stop = min(offset + SNAPSHOT_PAGE_ROWS, end)
+    users, tracks, timestamps = PLAY_LOG.export_columns(offset, stop)
     
-    if user_id not in USERS_DATABASE:
-        USERS_DATABASE[user_id] = {
-            "user_id": user_id,
-            "total_plays": 0,
-            "created_at": datetime.now().isoformat()
-        }
+    users_known = int(params.get("users_known", 0))
+    tracks_known = int(params.get("tracks_known", 0))
+    users_upto = _names_upto(users, users_known)
+    tracks_upto = _names_upto(tracks, tracks_known)
     
-    USERS_DATABASE[user_id]["total_plays"] += 1
+    return {
+        "position": CHANGES.position(),
+        "users_from": users_known,
+        "users": PLAY_LOG.users.names(users_known, users_upto),
+        "tracks_from": tracks_known,
+        "tracks": PLAY_LOG.tracks.names(tracks_known, tracks_upto),
+        "plays": {
+            "users": base64.b64encode(users).decode(),
+            "tracks": base64.b64encode(tracks).decode(),
+            "timestamps": base64.b64encode(timestamps).decode()
+        },
+        "next": {
+            "offset": stop,
+            "end": end,
+            "users_known": users_upto,
+            "tracks_known": tracks_upto
+        } if stop < end else None
+    }
+
+
+def load_snapshot(pages: list):
+    for page in pages:
+        for idx, name in enumerate(page["users"], page["users_from"]):
+            if name is not None:
+                PLAY_LOG.users.assign(name, idx)
+        for idx, name in enumerate(page["tracks"], page["tracks_from"]):
+            if name is not None:
+                PLAY_LOG.tracks.assign(name, idx)
+        
+        columns = page["plays"]
+        users, tracks, timestamps = array("I"), array("I"), array("q")
+        users.frombytes(base64.b64decode(columns["users"]))
+        tracks.frombytes(base64.b64decode(columns["tracks"]))
+        timestamps.frombytes(base64.b64decode(columns["timestamps"]))
+        _replay_rows(users, tracks, timestamps)
+    CO_OCCURRENCE.refresh()
     
-    return play_record
+    position = pages[0]["position"]
+    REPLICA.start_from(position["epoch"], position["seq"])
+
+
+def handle_change_event(ch, method, props, body):
+    event = json.loads(body.decode())
+    if not REPLICA.accept(event):
+        return
+    
+    if event.get("op") == "plays":
+        for user_id, music_id, played_at_ms in event.get("plays", []):
+            try:
+                _apply_play(user_id, music_id, played_at_ms)
+            except ValueError as e:
+                LOG.warning("Reprodução replicada descartada: %s", str(e))
+        CO_OCCURRENCE.refresh()
+
+
+def _plays_from_payload(payload: dict):
+    action = payload.get("action")
+    params = payload.get("params", {})
+    
+    if action == "play":
+        return [params]
+    if action == "play_batch":
+        return params.get("plays", [])
+    return []
+
+
+def flush_play_batch(ch):
+    if PENDING_DELIVERY["tag"] is None:
+        return
+    
+    started = time.perf_counter()
+    try:
+        accepted, rejected = register_plays(PENDING_PLAYS)
+        CO_OCCURRENCE.refresh()
+    except Exception:
+        LOG.exception("Falha ao aplicar lote de %d reproduções", len(PENDING_PLAYS))
+        accepted, rejected = 0, len(PENDING_PLAYS)
+    elapsed = time.perf_counter() - started
+    
+    ch.basic_ack(delivery_tag=PENDING_DELIVERY["tag"], multiple=True)
+    PENDING_PLAYS.clear()
+    PENDING_DELIVERY["tag"] = None
+    
+    INGEST_STATS["events"] += accepted
+    INGEST_STATS["rejected"] += rejected
+    INGEST_STATS["batches"] += 1
+    INGEST_STATS["apply_seconds"] += elapsed
+    INGEST_STATS["last_event_at"] = time.time()
+
+
+def handle_play_event(ch, method, props, body):
+    try:
+        PENDING_PLAYS.extend(_plays_from_payload(json.loads(body.decode())))
+    except Exception:
+        INGEST_STATS["rejected"] += 1
+    
+    if INGEST_STATS["first_event_at"] is None:
+        INGEST_STATS["first_event_at"] = time.time()
+    PENDING_DELIVERY["tag"] = method.delivery_tag
+    
+    if len(PENDING_PLAYS) >= PLAY_BATCH_SIZE:
+        flush_play_batch(ch)
+
+
+def _collect_metrics(registry):
+    registry.set_gauge("play_log_rows", len(PLAY_LOG))
+    registry.set_gauge("play_log_bytes", PLAY_LOG.nbytes())
+    registry.set_gauge("trending_buckets", GLOBAL_TRENDING.bucket_count())
+    registry.set_gauge("co_occurrence_pairs", CO_OCCURRENCE.pair_count())
+    registry.set_gauge("ingest_pending", len(PENDING_PLAYS))
+    registry.set_gauge("ingest_events", INGEST_STATS["events"])
+    registry.set_gauge("ingest_rejected", INGEST_STATS["rejected"])
+
+
+METRICS.add_collector(_collect_metrics)
+
+
+def get_ingest_stats():
+    events = INGEST_STATS["events"]
+    apply_seconds = INGEST_STATS["apply_seconds"]
+    first, last = INGEST_STATS["first_event_at"], INGEST_STATS["last_event_at"]
+    
+    return {
+        "events": events,
+        "rejected": INGEST_STATS["rejected"],
+        "batches": INGEST_STATS["batches"],
+        "pending": len(PENDING_PLAYS),
+        "avg_batch_size": round(events / INGEST_STATS["batches"], 1) if INGEST_STATS["batches"] else 0,
+        "apply_events_per_sec": round(events / apply_seconds) if apply_seconds else 0,
+        "ingest_events_per_sec": round(events / (last - first)) if first and last and last > first else 0
+    }
 
 
 def get_user_history(user_id: str, limit: int = 50):
-    user_history = [
-        record for record in PLAY_HISTORY
-        if record["user_id"] == user_id
-    ]
+    uid = PLAY_LOG.users.lookup(user_id)
+    user_rows = USER_HISTORY.get(uid)
     
-    user_history.sort(key=lambda x: x["played_at"], reverse=True)
+    if not user_rows or limit <= 0:
+        return []
     
-    return user_history[:limit]
+    return [PLAY_LOG.record(row) for row in user_rows[:-limit - 1:-1]]
 
 
 def get_most_played(user_id: str, limit: int = 10):
-    user_history = [
-        record for record in PLAY_HISTORY
-        if record["user_id"] == user_id
-    ]
+    uid = PLAY_LOG.users.lookup(user_id)
+    music_counter = USER_PLAY_COUNTS.get(uid)
+    
+    if not music_counter:
+        return []
     
-    music_counter = Counter(record["music_id"] for record in user_history)
     most_common = music_counter.most_common(limit)
     
     return [
-        {"music_id": music_id, "play_count": count}
-        for music_id, count in most_common
+        {"music_id": PLAY_LOG.tracks.name(tid), "play_count": count}
+        for tid, count in most_common
     ]
 
 
@@ -64,13 +534,10 @@ def get_user_stats(user_id: str):
     if not user:
         return {"error": "Usuário não encontrado"}
     
-    user_plays = [r for r in PLAY_HISTORY if r["user_id"] == user_id]
-    unique_songs = len(set(r["music_id"] for r in user_plays))
-    
     stats = {
         "user_id": user_id,
         "total_plays": user["total_plays"],
-        "unique_songs_played": unique_songs,
+        "unique_songs_played": user["unique_songs"],
         "member_since": user.get("created_at")
     }
     
@@ -78,41 +545,181 @@ def get_user_stats(user_id: str):
 
 
 def get_recent_plays_all(limit: int = 20):
-    recent = PLAY_HISTORY[-limit:] if len(PLAY_HISTORY) > limit else PLAY_HISTORY
-    recent.reverse()
-    return recent
+    return [
+        {
+            "user_id": PLAY_LOG.users.name(uid),
+            "music_id": PLAY_LOG.tracks.name(tid),
+            "played_at": ms_to_iso(played_at_ms)
+        }
+        for uid, tid, played_at_ms in RECENT_PLAYS.latest(limit)
+    ]
 
 
 def get_global_most_played(limit: int = 10):
-    music_counter = Counter(record["music_id"] for record in PLAY_HISTORY)
-    most_common = music_counter.most_common(limit)
+    return [
+        {"music_id": PLAY_LOG.tracks.name(tid), "play_count": count}
+        for tid, count, _error in GLOBAL_TOP.top(limit)
+    ]
+
+
+def _user_window_counts(uid, window: str) -> Counter:
+    user_rows = USER_HISTORY.get(uid)
+    if not user_rows:
+        return Counter()
+    start = bisect.bisect_left(user_rows, window_start(window, now_ms()), key=_row_timestamp)
+    return Counter(PLAY_LOG.row(row)[1] for row in user_rows[start:])
+
+
+def get_trending(window: str = "hour", user_id: str = None, limit: int = 10):
+    if window not in WINDOWS:
+        return {"error": f"Janela '{window}' inválida. Use: {', '.join(WINDOWS)}"}
+    
+    if user_id:
+        top = _user_window_counts(PLAY_LOG.users.lookup(user_id), window).most_common(limit)
+    else:
+        top = GLOBAL_TRENDING.top(window, now_ms(), limit)
+    
+    return [
+        {"music_id": PLAY_LOG.tracks.name(tid), "play_count": count}
+        for tid, count in top
+    ]
+
+
+def get_similar_tracks(music_id: str, limit: int = 10):
+    tid = PLAY_LOG.tracks.lookup(music_id)
+    if tid is None:
+        return []
     
     return [
-        {"music_id": music_id, "play_count": count}
-        for music_id, count in most_common
+        {"music_id": PLAY_LOG.tracks.name(other), "score": round(score, 4)}
+        for other, score in CO_OCCURRENCE.similar(tid, limit)
     ]
 
 
+def recommend_for_user(user_id: str, limit: int = 10):
+    play_counts = USER_PLAY_COUNTS.get(PLAY_LOG.users.lookup(user_id))
+    if not play_counts:
+        return []
+    
+    seeds = [
+        (tid, math.log1p(count))
+        for tid, count in play_counts.most_common(RECOMMENDATION_SEEDS)
+    ]
+    
+    return [
+        {"music_id": PLAY_LOG.tracks.name(tid), "score": round(score, 4)}
+        for tid, score in CO_OCCURRENCE.recommend(seeds, play_counts, limit)
+    ]
+
+
+def _parse_day(day: str = None) -> int:
+    if not day:
+        return now_ms() // DAY_MS
+    parsed = datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000) // DAY_MS
+
+
+def _find_sketch(scope: str, key: str = None):
+    if scope == "user":
+        play_counts = USER_PLAY_COUNTS.get(PLAY_LOG.users.lookup(key))
+        if not play_counts:
+            return None
+        sketch = HyperLogLog(HLL_PRECISION)
+        for tid in play_counts:
+            sketch.add_hash(_cached_hash(TRACK_HASHES, tid, PLAY_LOG.tracks))
+        return sketch
+    if scope == "track":
+        return TRACK_LISTENER_SKETCHES.get(PLAY_LOG.tracks.lookup(key))
+    if scope == "day_tracks":
+        return DAILY_TRACK_SKETCHES.get(_parse_day(key))
+    if scope == "day_listeners":
+        return DAILY_LISTENER_SKETCHES.get(_parse_day(key))
+    raise ValueError(f"Escopo '{scope}' inválido. Use: user, track, day_tracks, day_listeners")
+
+
+def get_unique_listeners(music_id: str):
+    sketch = _find_sketch("track", music_id)
+    return {
+        "music_id": music_id,
+        "unique_listeners": sketch.count() if sketch else 0
+    }
+
+
+def get_daily_uniques(day: str = None):
+    tracks = _find_sketch("day_tracks", day)
+    listeners = _find_sketch("day_listeners", day)
+    return {
+        "day": day or datetime.now(timezone.utc).date().isoformat(),
+        "unique_tracks": tracks.count() if tracks else 0,
+        "unique_listeners": listeners.count() if listeners else 0
+    }
+
+
+def export_sketch(scope: str, key: str = None):
+    sketch = _find_sketch(scope, key)
+    if sketch is None:
+        return None
+    return base64.b64encode(sketch.to_bytes()).decode()
+
+
+def merge_sketches(encoded_sketches: list):
+    merged = None
+    for encoded in encoded_sketches:
+        sketch = HyperLogLog.from_bytes(base64.b64decode(encoded))
+        merged = sketch if merged is None else merged.merge(sketch)
+    
+    if merged is None:
+        return {"estimate": 0, "sketch": None}
+    return {
+        "estimate": merged.count(),
+        "sketch": base64.b64encode(merged.to_bytes()).decode()
+    }
+
+
 def handle_request(ch, method, props, body):
+    started = time.perf_counter()
+    trace = None
+    action = None
+    
     try:
+        trace = from_properties(props)
+        stamp(trace, "users.recv")
         payload = json.loads(body.decode())
         action = payload.get("action")
         params = payload.get("params", {})
         
-        print(f"[service_users] Processando ação '{action}' com params={params}")
+        REQUEST_LOG.debug("Processando ação '%s'", action, extra={"params": params})
         
-        time.sleep(0.15)
+        time.sleep(0.15 * SIMULATED_LATENCY_SCALE)
         
-        if action == "play":
+        if REPLICA is not None and action in WRITE_ACTIONS:
+            response = {"error": f"Ação '{action}' não é atendida por réplicas de leitura"}
+            
+        elif action == "play":
             user_id = params.get("user_id")
             music_id = params.get("music_id")
             
-            if not user_id or not music_id:
-                response = {"error": "user_id e music_id são obrigatórios"}
+            if not _valid_id(user_id) or not _valid_id(music_id):
+                response = {"error": "user_id e music_id são obrigatórios (texto)"}
             else:
                 result = register_play(user_id, music_id)
                 response = {"play_record": result, "success": True}
                 
+        elif action == "play_batch":
+            plays = params.get("plays", [])
+            
+            if not isinstance(plays, list):
+                response = {"error": "plays deve ser uma lista"}
+            else:
+                accepted, rejected = register_plays(plays)
+                response = {"accepted": accepted, "rejected": rejected, "success": True}
+                
+        elif action == "ingest_stats":
+            response = {"ingest": get_ingest_stats()}
+            
+        elif action == "replication_snapshot":
+            response = export_snapshot(params)
+            
         elif action == "get_history":
             user_id = params.get("user_id")
             limit = params.get("limit", 50)
@@ -140,39 +747,189 @@ def handle_request(ch, method, props, body):
             result = get_global_most_played(limit)
             response = {"global_most_played": result, "count": len(result)}
             
+        elif action == "trending":
+            window = params.get("window", "hour")
+            user_id = params.get("user_id")
+            limit = params.get("limit", 10)
+            result = get_trending(window, user_id, limit)
+            
+            if isinstance(result, dict):
+                response = result
+            else:
+                response = {"trending": result, "window": window, "count": len(result)}
+            
+        elif action == "similar_tracks":
+            music_id = params.get("music_id")
+            limit = params.get("limit", 10)
+            
+            if not music_id:
+                response = {"error": "music_id é obrigatório"}
+            else:
+                result = get_similar_tracks(music_id, limit)
+                response = {"music_id": music_id, "similar": result, "count": len(result)}
+            
+        elif action == "recommend_for_user":
+            user_id = params.get("user_id")
+            limit = params.get("limit", 10)
+            result = recommend_for_user(user_id, limit)
+            response = {"user_id": user_id, "recommendations": result, "count": len(result)}
+            
+        elif action == "unique_listeners":
+            music_id = params.get("music_id")
+            
+            if not music_id:
+                response = {"error": "music_id é obrigatório"}
+            else:
+                response = {"stats": get_unique_listeners(music_id)}
+            
+        elif action == "daily_uniques":
+            day = params.get("day")
+            response = {"stats": get_daily_uniques(day)}
+            
+        elif action == "export_sketch":
+            scope = params.get("scope")
+            key = params.get("key")
+            result = export_sketch(scope, key)
+            response = {"scope": scope, "key": key, "sketch": result}
+            
+        elif action == "merge_sketches":
+            sketches = params.get("sketches", [])
+            response = merge_sketches(sketches)
+            
+        elif action == "metrics":
+            if params.get("format") == "prometheus":
+                response = {"metrics": METRICS.to_prometheus()}
+            else:
+                response = {"metrics": METRICS.snapshot()}
+            
         else:
             response = {"error": f"Ação '{action}' não reconhecida"}
         
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        LOG.exception("Falha ao processar ação '%s'", action)
         response = {"error": str(e)}
     
+    if REPLICA is not None:
+        response["replication"] = REPLICA.status()
+    
+    stamp(trace, "users.reply")
     ch.basic_publish(
         exchange="",
         routing_key=props.reply_to,
-        properties=pika.BasicProperties(correlation_id=props.correlation_id),
+        properties=pika.BasicProperties(correlation_id=props.correlation_id, headers=headers_for(trace)),
         body=json.dumps(response),
     )
     ch.basic_ack(delivery_tag=method.delivery_tag)
-    print(f"[service_users] Resposta enviada para '{action}'")
+    action_label = bounded_label(action, ACTIONS)
+    METRICS.observe("request_latency_ms", (time.perf_counter() - started) * 1000, action=action_label)
+    if "error" in response:
+        METRICS.inc("errors_total", action=action_label)
+    REQUEST_LOG.debug("Resposta enviada para '%s'", action)
 
 
-def main():
+def reset_state():
+    global PLAY_LOG, RECENT_PLAYS, CO_OCCURRENCE, GLOBAL_TOP, GLOBAL_TRENDING
+    
+    PLAY_LOG = PlayLog()
+    RECENT_PLAYS = RecentPlaysRing(RECENT_PLAYS_CAPACITY)
+    CO_OCCURRENCE = CoOccurrenceIndex()
+    GLOBAL_TOP = StreamSummary(capacity=GLOBAL_TOP_CAPACITY)
+    GLOBAL_TRENDING = BucketedCounter()
+    for index in (USERS_DATABASE, USER_HISTORY, USER_PLAY_COUNTS, TRACK_LISTENER_SKETCHES,
+                  DAILY_TRACK_SKETCHES, DAILY_LISTENER_SKETCHES):
+        index.clear()
+    USER_HASHES.clear()
+    TRACK_HASHES.clear()
+
+
+def run_replica():
+    global REPLICA
+    REPLICA = ReplicaState()
+    
+    conn = build_connection()
+    changes_ch = conn.channel()
+    changes_queue = subscribe_changes(changes_ch, "users")
+    
+    wait_for_snapshot(conn, QUEUE_NAME, load_snapshot)
+    LOG.info("Réplica iniciada com %d reproduções do primário", len(PLAY_LOG))
+    
+    changes_ch.basic_consume(queue=changes_queue, on_message_callback=handle_change_event, auto_ack=True)
+    
+    ch = configure_channel_for_consume(conn)
+    declare_queue(ch, READ_QUEUE_NAME)
+    heartbeat = None
+    
+    # Fora de sincronia a réplica sai do ar (heartbeat "down" e sem consumir leituras), descarta o
+    # estado e recarrega o snapshot antes de voltar a atender.
+    try:
+        while True:
+            read_tag = ch.basic_consume(queue=READ_QUEUE_NAME, on_message_callback=handle_request)
+            heartbeat = Heartbeat("users", READ_QUEUE_NAME, [a for a in ACTIONS if a not in WRITE_ACTIONS])
+            heartbeat.start()
+            LOG.info("Réplica de leitura aguardando requisições na fila '%s'", READ_QUEUE_NAME)
+            
+            while REPLICA.in_sync:
+                conn.process_data_events(time_limit=1)
+            
+            LOG.warning("Réplica fora de sincronia com o primário; recarregando snapshot")
+            heartbeat.stop()
+            ch.basic_cancel(read_tag)
+            reset_state()
+            wait_for_snapshot(conn, QUEUE_NAME, load_snapshot)
+            LOG.info("Réplica ressincronizada com %d reproduções", len(PLAY_LOG))
+    except KeyboardInterrupt:
+        LOG.info("Encerrando...")
+    finally:
+        if heartbeat is not None:
+            heartbeat.stop()
+        conn.close()
+
+
+def run_primary():
+    open_play_store()
+    
     conn = build_connection()
     ch = configure_channel_for_consume(conn)
     declare_queue(ch, QUEUE_NAME)
+    CHANGES.attach(conn.channel())
     
     ch.basic_consume(queue=QUEUE_NAME, on_message_callback=handle_request)
+    heartbeat = Heartbeat("users", QUEUE_NAME, ACTIONS)
+    heartbeat.start()
+    
+    events_ch = configure_channel_for_consume(conn, prefetch_count=PLAY_BATCH_SIZE * 2)
+    declare_queue(events_ch, EVENTS_QUEUE_NAME)
+    events_ch.basic_consume(queue=EVENTS_QUEUE_NAME, on_message_callback=handle_play_event)
     
-    print(f"[service_users] Aguardando requisições na fila '{QUEUE_NAME}'")
+    def flush_periodically():
+        flush_play_batch(events_ch)
+        conn.call_later(PLAY_BATCH_INTERVAL, flush_periodically)
+    
+    conn.call_later(PLAY_BATCH_INTERVAL, flush_periodically)
+    
+    LOG.info("Aguardando requisições na fila '%s' e eventos em '%s'", QUEUE_NAME, EVENTS_QUEUE_NAME)
     
     try:
         ch.start_consuming()
     except KeyboardInterrupt:
-        print("\n[service_users] Encerrando...")
+        LOG.info("Encerrando...")
     finally:
+        heartbeat.stop()
         conn.close()
+        if PLAY_STORE is not None:
+            PLAY_STORE.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serviço de usuários e histórico")
+    parser.add_argument("--replica", action="store_true",
+                       help="Executar como réplica de leitura alimentada pelo primário")
+    args = parser.parse_args()
+    
+    if args.replica:
+        run_replica()
+    else:
+        run_primary()
 
 
 if __name__ == "__main__":
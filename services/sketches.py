@@ -0,0 +1,231 @@
+import bisect
+import hashlib
+import math
+from array import array
+
+class _Bucket:
+    __slots__ = ("count", "items", "prev", "next")
+
+    def __init__(self, count: int):
+        self.count = count
+        self.items = {}
+        self.prev = None
+        self.next = None
+
+
+# Sem capacity as contagens são exatas; com capacity vira Space-Saving
+# (o item de menor contagem é substituído e sua contagem vira o erro do novo).
+class StreamSummary:
+    def __init__(self, capacity: int = None):
+        self.capacity = capacity
+        self._index = {}
+        self._head = None
+        self._tail = None
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, item):
+        return item in self._index
+
+    def count(self, item) -> int:
+        bucket = self._index.get(item)
+        return bucket.count if bucket else 0
+
+    def _link_after(self, prev, bucket):
+        nxt = prev.next if prev else self._head
+        bucket.prev = prev
+        bucket.next = nxt
+        if prev:
+            prev.next = bucket
+        else:
+            self._head = bucket
+        if nxt:
+            nxt.prev = bucket
+        else:
+            self._tail = bucket
+
+    def _unlink(self, bucket):
+        if bucket.prev:
+            bucket.prev.next = bucket.next
+        else:
+            self._head = bucket.next
+        if bucket.next:
+            bucket.next.prev = bucket.prev
+        else:
+            self._tail = bucket.prev
+
+    def increment(self, item, amount: int = 1):
+        bucket = self._index.get(item)
+        error = 0
+
+        if bucket is not None:
+            error = bucket.items.pop(item)
+            new_count = bucket.count + amount
+            prev = bucket
+        elif self.capacity and len(self._index) >= self.capacity:
+            bucket = self._head
+            victim = next(iter(bucket.items))
+            del bucket.items[victim]
+            del self._index[victim]
+            error = bucket.count
+            new_count = bucket.count + amount
+            prev = bucket
+        else:
+            new_count = amount
+            prev = None
+
+        nxt = prev.next if prev else self._head
+        while nxt and nxt.count < new_count:
+            prev = nxt
+            nxt = nxt.next
+
+        if nxt and nxt.count == new_count:
+            target = nxt
+        else:
+            target = _Bucket(new_count)
+            self._link_after(prev, target)
+
+        target.items[item] = error
+        self._index[item] = target
+
+        if bucket is not None and not bucket.items:
+            self._unlink(bucket)
+
+    def top(self, k: int):
+        result = []
+        bucket = self._tail
+        while bucket and len(result) < k:
+            for item, error in bucket.items.items():
+                result.append((item, bucket.count, error))
+                if len(result) >= k:
+                    break
+            bucket = bucket.prev
+        return result
+
+
+HLL_MAX_PRECISION = 16
+_INV_POW2 = [2.0 ** -i for i in range(65)]
+
+
+def hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+# Começa esparso: pares (registrador << 8 | rank) ordenados em um array de 4 bytes cada, que vira
+# o vetor denso de 2^p bytes quando passa de m/8 entradas. A maioria das músicas tem poucos
+# ouvintes, então a maior parte dos sketches nunca chega a ocupar m bytes.
+class HyperLogLog:
+    __slots__ = ("precision", "m", "registers", "_sparse")
+
+    def __init__(self, precision: int = 10, registers: bytes = None):
+        if not 4 <= precision <= HLL_MAX_PRECISION:
+            raise ValueError(f"precisão deve estar entre 4 e {HLL_MAX_PRECISION}")
+
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = None
+        self._sparse = None
+
+        if registers:
+            self.registers = bytearray(registers)
+            if len(self.registers) != self.m:
+                raise ValueError("número de registradores incompatível com a precisão")
+        else:
+            self._sparse = array("I")
+
+    @property
+    def is_sparse(self) -> bool:
+        return self._sparse is not None
+
+    def _promote(self):
+        registers = bytearray(self.m)
+        for entry in self._sparse:
+            registers[entry >> 8] = entry & 0xFF
+        self.registers = registers
+        self._sparse = None
+
+    def _set_max(self, idx: int, rank: int):
+        sparse = self._sparse
+        if sparse is None:
+            if rank > self.registers[idx]:
+                self.registers[idx] = rank
+            return
+
+        pos = bisect.bisect_left(sparse, idx << 8)
+        if pos < len(sparse) and sparse[pos] >> 8 == idx:
+            if rank > sparse[pos] & 0xFF:
+                sparse[pos] = idx << 8 | rank
+            return
+        sparse.insert(pos, idx << 8 | rank)
+        if len(sparse) * 8 > self.m:
+            self._promote()
+
+    def add_hash(self, h: int):
+        idx = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - rest.bit_length() + 1
+        if self._sparse is None:
+            if rank > self.registers[idx]:
+                self.registers[idx] = rank
+        else:
+            self._set_max(idx, rank)
+
+    def add_hashes(self, hashes):
+        shift = 64 - self.precision
+        mask = (1 << shift) - 1
+        for h in hashes:
+            idx = h >> shift
+            rank = shift - (h & mask).bit_length() + 1
+            if self._sparse is None:
+                if rank > self.registers[idx]:
+                    self.registers[idx] = rank
+            else:
+                self._set_max(idx, rank)
+
+    def add(self, value: str):
+        self.add_hash(hash64(value))
+
+    def dense_registers(self) -> bytes:
+        if self._sparse is None:
+            return bytes(self.registers)
+        registers = bytearray(self.m)
+        for entry in self._sparse:
+            registers[entry >> 8] = entry & 0xFF
+        return bytes(registers)
+
+    def count(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+
+        if self._sparse is None:
+            zeros = self.registers.count(0)
+            harmonic = sum(map(_INV_POW2.__getitem__, self.registers))
+        else:
+            zeros = m - len(self._sparse)
+            harmonic = zeros + sum(_INV_POW2[entry & 0xFF] for entry in self._sparse)
+
+        estimate = alpha * m * m / harmonic
+        if zeros and estimate <= 2.5 * m:
+            estimate = m * math.log(m / zeros)
+
+        return round(estimate)
+
+    def merge(self, other: "HyperLogLog"):
+        if other.precision != self.precision:
+            raise ValueError("sketches com precisões diferentes não podem ser combinados")
+        if other.is_sparse:
+            for entry in other._sparse:
+                self._set_max(entry >> 8, entry & 0xFF)
+            return self
+        if self._sparse is not None:
+            self._promote()
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def to_bytes(self) -> bytes:
+        return bytes([self.precision]) + self.dense_registers()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        return cls(precision=data[0], registers=data[1:])
@@ -0,0 +1,90 @@
+from collections import Counter
+
+MINUTE_MS = 60 * 1000
+HOUR_MS = 60 * MINUTE_MS
+DAY_MS = 24 * HOUR_MS
+
+TIERS = (
+    (MINUTE_MS, 60),
+    (HOUR_MS, 24),
+    (DAY_MS, 7),
+)
+
+WINDOWS = {
+    "hour": 0,
+    "day": 1,
+    "week": 2,
+}
+
+
+def window_start(window: str, now_ms: int) -> int:
+    width, retention = TIERS[WINDOWS[window]]
+    return now_ms - now_ms % width - (retention - 1) * width
+
+
+class _Tier:
+    __slots__ = ("width", "retention", "buckets", "newest")
+
+    def __init__(self, width: int, retention: int):
+        self.width = width
+        self.retention = retention
+        self.buckets = {}
+        self.newest = None
+
+    def cutoff(self, reference_start: int) -> int:
+        return reference_start - (self.retention - 1) * self.width
+
+    def expire(self):
+        cutoff = self.cutoff(self.newest)
+        for start in [s for s in self.buckets if s < cutoff]:
+            del self.buckets[start]
+
+
+class BucketedCounter:
+    def __init__(self, tiers=TIERS):
+        self._tiers = [_Tier(width, retention) for width, retention in tiers]
+
+    def _bucket(self, tier: _Tier, timestamp_ms: int):
+        start = timestamp_ms - timestamp_ms % tier.width
+        counter = tier.buckets.get(start)
+
+        if counter is None:
+            if tier.newest is not None and start < tier.cutoff(tier.newest):
+                return None
+            counter = tier.buckets[start] = Counter()
+            if tier.newest is None or start > tier.newest:
+                tier.newest = start
+                tier.expire()
+
+        return counter
+
+    def add(self, key, timestamp_ms: int, amount: int = 1):
+        for tier in self._tiers:
+            counter = self._bucket(tier, timestamp_ms)
+            if counter is not None:
+                counter[key] += amount
+
+    def widths(self) -> list:
+        return [tier.width for tier in self._tiers]
+
+    def add_bucket(self, tier_index: int, start: int, counts: dict):
+        tier = self._tiers[tier_index]
+        counter = self._bucket(tier, start)
+        if counter is not None:
+            counter.update(counts)
+
+    def window_counts(self, window: str, now_ms: int) -> Counter:
+        tier = self._tiers[WINDOWS[window]]
+        cutoff = tier.cutoff(now_ms - now_ms % tier.width)
+
+        merged = Counter()
+        for start, counter in tier.buckets.items():
+            if start >= cutoff:
+                merged.update(counter)
+        return merged
+
+    def top(self, window: str, now_ms: int, limit: int = 10):
+        return self.window_counts(window, now_ms).most_common(limit)
+
+    def bucket_count(self) -> int:
+        return sum(len(tier.buckets) for tier in self._tiers)
@@ -0,0 +1,87 @@
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+TRACE_HEADER = "x-trace"
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+
+
+def start_trace(sample_rate: float = None):
+    rate = TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+    if rate <= 0 or random.random() >= rate:
+        return None
+    return {"id": uuid.uuid4().hex[:16], "stamps": []}
+
+
+def stamp(trace, hop: str):
+    if trace is not None:
+        trace["stamps"].append([hop, time.time() * 1000])
+
+
+def from_properties(props):
+    headers = getattr(props, "headers", None)
+    if not headers or TRACE_HEADER not in headers:
+        return None
+    value = headers[TRACE_HEADER]
+    if isinstance(value, bytes):
+        value = value.decode(errors="replace")
+    try:
+        trace = json.loads(value)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(trace, dict) or not isinstance(trace.get("stamps"), list):
+        return None
+    return trace
+
+
+def headers_for(trace):
+    if trace is None:
+        return None
+    return {TRACE_HEADER: json.dumps(trace)}
+
+
+def breakdown(trace) -> dict:
+    stamps = trace["stamps"]
+    spans = {}
+    for (prev_hop, prev_ts), (hop, ts) in zip(stamps, stamps[1:]):
+        spans[f"{prev_hop}->{hop}"] = round(ts - prev_ts, 3)
+    if len(stamps) > 1:
+        spans["total"] = round(stamps[-1][1] - stamps[0][1], 3)
+    return spans
+
+
+def attach(response, trace):
+    if trace is not None and isinstance(response, dict):
+        response["_trace"] = {"id": trace.get("id"), "stamps": trace["stamps"], "spans": breakdown(trace)}
+    return response
+
+
+class TraceAggregator:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans = {}
+
+    def add(self, service: str, action: str, spans: dict):
+        key = f"{service}.{action}"
+        with self._lock:
+            per_action = self._spans.setdefault(key, {})
+            for name, value in spans.items():
+                entry = per_action.get(name)
+                if entry is None:
+                    entry = per_action[name] = [0, 0.0, value]
+                entry[0] += 1
+                entry[1] += value
+                entry[2] = max(entry[2], value)
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                key: {
+                    name: {"count": count, "mean_ms": round(total / count, 3), "max_ms": round(peak, 3)}
+                    for name, (count, total, peak) in spans.items()
+                }
+                for key, spans in self._spans.items()
+            }